@@ -3,15 +3,15 @@
 Generate architecture diagram PNG from the current ASCII diagram in README.md
 """
 
-# noinspection PyPackageRequirements
-import matplotlib.pyplot as plt
-# noinspection PyPackageRequirements
-from matplotlib.patches import FancyBboxPatch
-
-
-# noinspection PyPackageRequirements
 
 def create_architecture_diagram():
+    # Imported here so that importing this module (test collection, doc
+    # tooling) does not pay for matplotlib and its font cache
+    # noinspection PyPackageRequirements
+    import matplotlib.pyplot as plt
+    # noinspection PyPackageRequirements
+    from matplotlib.patches import FancyBboxPatch
+
     fig, ax = plt.subplots(1, 1, figsize=(14, 10))
 
     # Colors
@@ -1,8 +1,9 @@
 from abc import abstractmethod
-from typing import Callable
+from typing import Callable, Optional, Sequence
 
 from python_trading_telegram_declarative.classes.command import Command
 from python_trading_telegram_declarative.history import TelegramHistoryManager
+from python_trading_telegram_declarative.message_queue import RateLimiter
 from python_trading_telegram_declarative.service import TelegramService
 
 CommandsHandlers = list[Callable[[Command], str]]
@@ -22,9 +23,21 @@ class BaseService(TelegramService):
             chat_id,
             endpoints,
             history_manager: TelegramHistoryManager,
+            allowed_updates: Optional[Sequence[str]] = None,
+            rate_limiter: Optional[RateLimiter] = None,
     ):
-        super().__init__(api_base_url, bot_token, chat_id, endpoints, history_manager)
-        self.start()  # Auto-start for compatibility with old API
+        super().__init__(
+            api_base_url,
+            bot_token,
+            chat_id,
+            endpoints,
+            history_manager,
+            allowed_updates,
+            rate_limiter,
+        )
+        # Auto-start for compatibility with old API. start() only spawns
+        # threads, so construction does not block, even inside an event loop
+        self.start()
 
     @abstractmethod
     def process_commands(self):
@@ -4,10 +4,15 @@ from typing import Optional, Type
 class DynamicEnumMember:
     """Représente un membre d'un enum dynamique (ex: Command.HELP)."""
 
+    __slots__ = ("name", "value", "parent_enum", "_hash")
+
     def __init__(self, name: str, value: str, parent_enum: Type["DynamicEnum"]):
         self.name = name
         self.value = value
         self.parent_enum = parent_enum
+        # Les membres servent de clés dans les index de dispatch : le hachage
+        # est calculé une seule fois
+        self._hash = hash((value, parent_enum.__name__))
 
     def __repr__(self) -> str:
         return f"<{self.parent_enum.__name__}.{self.name}: '{self.value}'>"
@@ -22,7 +27,7 @@ class DynamicEnumMember:
 
     def __hash__(self) -> int:
         # Nécessaire pour utiliser les membres comme clés de dictionnaire
-        return hash((self.value, self.parent_enum.__name__))
+        return self._hash
 
 
 class DynamicEnum:
@@ -44,8 +49,9 @@ class DynamicEnum:
     @classmethod
     def from_value(cls, value: str) -> Optional[DynamicEnumMember]:
         """Retrouve un membre par sa valeur."""
-        if value in cls._value_map:
-            return cls._value_map[value]
+        member = cls._value_map.get(value)
+        if member is not None:
+            return member
         # Créer dynamiquement si non existant (pour les handlers)
         name = value.lstrip("/").upper()
         member = DynamicEnumMember(name, value, parent_enum=cls)
@@ -1,16 +1,38 @@
+import random
 import time
 from typing import Optional
 
 import requests
 from requests import Response
+from requests.adapters import HTTPAdapter
 
 from python_trading_telegram_declarative.tools.logger import logger
+from python_trading_telegram_declarative.tools.utils import json_loads
+
+
+# Retry backoff: full jitter over base * 2^attempt, capped
+_BACKOFF_BASE = 0.5
+_MAX_BACKOFF = 30.0
+
+# HTTP statuses worth retrying (timeouts, rate limiting, transient server
+# errors); any other error status is reported at once
+_RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Connections kept per host (requests' default): besides the long poll and the
+# sender, flush_outgoing_queue(), test_updates() and the webhook registration
+# may use the client from other threads at the same time
+_POOL_MAXSIZE = 10
 
 
 class TelegramAPIError(Exception):
-    """Specific exception for Telegram API errors."""
+    """
+    Specific exception for Telegram API errors.
+    retry_after is the delay requested by Telegram when rate limited (429).
+    """
 
-    pass
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 
 class TelegramNetworkError(Exception):
@@ -36,6 +58,20 @@ class TelegramClient:
         self.__url_updates = (
             f"{self.__api_base_url}{self.__bot_token}{self.__updates_endpoint}"
         )
+        self.__url_set_webhook = f"{self.__api_base_url}{self.__bot_token}/setWebhook"
+        self.__url_delete_webhook = (
+            f"{self.__api_base_url}{self.__bot_token}/deleteWebhook"
+        )
+        # Persistent session: TCP/TLS connections are kept alive between calls
+        self.__session = requests.Session()
+        # One host only: a single pool, sized for every thread sharing the client
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_POOL_MAXSIZE)
+        self.__session.mount("https://", adapter)
+        self.__session.mount("http://", adapter)
+
+    def close(self):
+        """Closes the pooled connections."""
+        self.__session.close()
 
     def send_message(self, payload: dict, max_retries: int = 3) -> Optional[Response]:
         """Sends a message via Telegram API with automatic retry."""
@@ -44,54 +80,53 @@ class TelegramClient:
     def get_updates(self, params: dict, timeout: tuple[int, int] = (3, 30)) -> dict:
         """Retrieves updates via Telegram API."""
         try:
-            response = requests.get(self.__url_updates, params=params, timeout=timeout)
+            response = self.__session.get(
+                self.__url_updates, params=params, timeout=timeout
+            )
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            # Parsed from the raw bytes with the fastest available decoder
+            return json_loads(response.content)
+        except (requests.RequestException, ValueError) as e:  # ValueError: invalid JSON
             logger.error("Error during getUpdates: %s", e)
             raise TelegramNetworkError(f"getUpdates network error: {e}")
 
-    @staticmethod
+    def set_webhook(
+            self,
+            url: str,
+            secret_token: Optional[str] = None,
+            allowed_updates: Optional[str] = None,
+    ) -> Optional[Response]:
+        """
+        Registers the URL to which Telegram pushes updates.
+        A single connection keeps updates in order, as with getUpdates.
+        allowed_updates is a JSON-serialized list of update types.
+        """
+        payload = {"url": url, "max_connections": 1}
+        if secret_token:
+            payload["secret_token"] = secret_token
+        if allowed_updates:
+            payload["allowed_updates"] = allowed_updates
+        return self._post_with_retry(self.__url_set_webhook, payload)
+
+    def delete_webhook(self) -> Optional[Response]:
+        """Removes the webhook, so that getUpdates can be used again."""
+        return self._post_with_retry(self.__url_delete_webhook, {})
+
     def _post_with_retry(
-            url: str, payload: dict, max_retries: int = 3
+            self, url: str, payload: dict, max_retries: int = 3
     ) -> Optional[Response]:
         """Sends a POST request with automatic retry."""
         last_exception = None
+        last_status_code = None
+        retry_after = None
 
         for attempt in range(max_retries):
             try:
-                response = requests.post(url, data=payload, timeout=(3, 10))
-                response.raise_for_status()
-                return response
-
-            except requests.HTTPError as e:
-                status_code = e.response.status_code if e.response else None
-
-                # Non-recoverable errors (4xx except 429)
-                if status_code and 400 <= status_code < 500 and status_code != 429:
-                    logger.error(
-                        "Non-recoverable HTTP error %d: %s",
-                        status_code,
-                        e.response.text if e.response else str(e),
-                    )
-                    raise TelegramAPIError(f"Telegram API error {status_code}: {e}")
-
-                # Recoverable errors (5xx, 429, timeout)
-                last_exception = e
-                wait_time = (2 ** attempt) * 0.5  # exponential backoff
-                if attempt < max_retries - 1:
-                    logger.warning(
-                        "Attempt %d/%d failed (HTTP %s), retrying in %.1fs",
-                        attempt + 1,
-                        max_retries,
-                        status_code,
-                        wait_time,
-                    )
-                    time.sleep(wait_time)
+                response = self.__session.post(url, data=payload, timeout=(3, 10))
 
             except (requests.ConnectionError, requests.Timeout) as e:
                 last_exception = e
-                wait_time = (2 ** attempt) * 0.5
+                wait_time = self._backoff_delay(attempt)
                 if attempt < max_retries - 1:
                     logger.warning(
                         "Network error (attempt %d/%d), retrying in %.1fs: %s",
@@ -101,18 +136,82 @@ class TelegramClient:
                         str(e),
                     )
                     time.sleep(wait_time)
+                continue
 
             except requests.RequestException as e:
                 logger.error("Unexpected request error: %s", e)
                 raise TelegramNetworkError(f"Network error: {e}")
 
+            # Status checked directly: no HTTPError raised and caught per reply
+            status_code = response.status_code
+            if status_code < 400:
+                return response
+
+            # Non-recoverable errors
+            if status_code not in _RETRYABLE_STATUS:
+                logger.error(
+                    "Non-recoverable HTTP error %d: %s", status_code, response.text
+                )
+                raise TelegramAPIError(
+                    f"Telegram API error {status_code}: {response.text}"
+                )
+
+            # Recoverable errors
+            last_exception = None
+            last_status_code = status_code
+            retry_after = self._retry_after(response) if status_code == 429 else None
+            if retry_after is not None and retry_after > _MAX_BACKOFF:
+                # Not slept here: the caller decides whether to wait that long
+                logger.warning("Rate limited for %.0fs, giving up", retry_after)
+                raise TelegramAPIError(
+                    f"Telegram API error 429: retry after {retry_after:.0f}s",
+                    retry_after=retry_after,
+                )
+            wait_time = self._backoff_delay(attempt, retry_after)
+            if attempt < max_retries - 1:
+                logger.warning(
+                    "Attempt %d/%d failed (HTTP %s), retrying in %.1fs",
+                    attempt + 1,
+                    max_retries,
+                    status_code,
+                    wait_time,
+                )
+                time.sleep(wait_time)
+
         # All attempts failed
         logger.error("Failed after %d attempts, giving up", max_retries)
-        if isinstance(last_exception, requests.HTTPError):
+        if last_exception is None:
             raise TelegramAPIError(
-                f"API Error after {max_retries} attempts: {last_exception}"
+                f"API Error after {max_retries} attempts: HTTP {last_status_code}",
+                retry_after=retry_after,
             )
         else:
             raise TelegramNetworkError(
                 f"Network Error after {max_retries} attempts: {last_exception}"
             )
+
+    @staticmethod
+    def _backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Exponential backoff with full jitter, so that clients failing together
+        do not retry together. A server-provided Retry-After is a floor.
+        """
+        delay = random.uniform(0, min(_MAX_BACKOFF, _BACKOFF_BASE * (1 << attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def _retry_after(response: Response) -> Optional[float]:
+        """
+        Delay requested by a 429 response, if any: the Retry-After header,
+        else the retry_after parameter of Telegram's JSON error body.
+        """
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, TypeError, ValueError):
+            pass
+        try:
+            return float(json_loads(response.content)["parameters"]["retry_after"])
+        except (KeyError, TypeError, ValueError):
+            return None
@@ -1,3 +1,4 @@
+import functools
 from abc import abstractmethod
 from typing import Union
 
@@ -25,19 +26,21 @@ class TelegramHandler:
             action = action_data.get("action")
             # Find the action definition to know the expected argument names
             kwargs = {}
-            for i, (key, expected_type) in enumerate(action_data["kwargs"].items()):
-                if i < len(arguments):
-                    try:
-                        # Convert the argument to expected type if specified
-                        kwargs[key] = expected_type(arguments[i])
-                    except ValueError:
-                        # If conversion fails, return an error message
-                        return [
-                            {
-                                "text": f"Argument '{key}' must be of type {expected_type.__name__}.",
-                                "reply_markup": "",
-                            }
-                        ]
+            # zip stops at the shorter side: missing arguments keep their defaults
+            for (key, expected_type), argument in zip(
+                    action_data["kwargs"].items(), arguments
+            ):
+                try:
+                    # Convert the argument to expected type if specified
+                    kwargs[key] = expected_type(argument)
+                except ValueError:
+                    # If conversion fails, return an error message
+                    return [
+                        {
+                            "text": f"Argument '{key}' must be of type {expected_type.__name__}.",
+                            "reply_markup": "",
+                        }
+                    ]
 
             return action(*action_data.get("args"), **kwargs)  # action(**kwargs)
         else:
@@ -51,19 +54,31 @@ class TelegramHandler:
     def command_actions(self) -> CommandActionType:
         """
         Property that returns a dictionary of commands and their associated actions.
+        Its content must stay static: find_action() dispatches from a table built
+        on first use. Call refresh_actions() after changing it.
         """
         pass
 
     def find_action(
             self, command: Union[Command, Menu]
     ) -> dict:  # <-- Specify possible Enum types
-        action_data = {}
-        for key, value in self.command_actions.items():
-            if command in value:
-                action_data = value.get(
-                    command, {}
-                )  # Using .get with default value is safer
-        return action_data
+        return self._actions_by_command.get(command, {})
+
+    @functools.cached_property
+    def _actions_by_command(self) -> dict:
+        """
+        Flat command -> action data table, built on first dispatch.
+        When several menus declare a command, the last one wins.
+        This is a snapshot of command_actions, see refresh_actions().
+        """
+        actions_by_command = {}
+        for actions in self.command_actions.values():
+            actions_by_command.update(actions)
+        return actions_by_command
+
+    def refresh_actions(self):
+        """Drops the command table so the next dispatch rebuilds it from command_actions."""
+        self.__dict__.pop("_actions_by_command", None)
 
     # noinspection PyUnresolvedReferences
     def register_enums(self):
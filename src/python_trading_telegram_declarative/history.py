@@ -1,39 +1,349 @@
-import json
+import atexit
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
 from typing import Optional
 
 from python_trading_telegram_declarative.classes.command import Command
 from python_trading_telegram_declarative.classes.enums import DynamicEnumMember
 from python_trading_telegram_declarative.classes.types import CurrentPrompt
+from python_trading_telegram_declarative.tools.logger import logger
+from python_trading_telegram_declarative.tools.utils import json_dumps, json_loads
+
+# Nombre maximal d'interactions écrites par transaction
+_MAX_WRITE_BATCH = 256
+
+# Intervalle minimal, en secondes, entre deux purges de l'historique
+_PRUNE_INTERVAL = 60
+
+# Réglages de la connexion. En mode WAL, NORMAL ne synchronise qu'aux
+# checkpoints : un seul append séquentiel par COMMIT au lieu de deux fsync
+_CONNECTION_PRAGMAS_SQL = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-8192; -- 8 Mo
+"""
+
+# Persistant dans le fichier : les lecteurs ne bloquent plus l'écrivain (et
+# inversement)
+_WAL_PRAGMA_SQL = """
+    PRAGMA journal_mode=WAL;
+"""
+
+# Requêtes SQL partagées : compilées une fois puis réutilisées via le cache
+# d'instructions de la connexion
+_CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS interactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL, -- Epoch UTC en nanosecondes
+        direction TEXT NOT NULL, -- 'incoming' or 'outgoing'
+        chat_id INTEGER NOT NULL,
+        update_id INTEGER, -- Uniquement pour 'incoming'
+        message_type TEXT NOT NULL, -- 'text', 'callback_query'
+        content TEXT NOT NULL, -- Le message/payload en JSON
+        is_prompt BOOLEAN DEFAULT FALSE,
+        prompt_status TEXT DEFAULT NULL, -- 'active', 'resolved'
+        -- Champs du prompt, lus sans décoder content
+        prompt_action TEXT,
+        prompt_command TEXT,
+        prompt_arguments TEXT, -- Liste JSON
+        prompt_index INTEGER
+    )
+"""
+
+# Colonnes ajoutées par la migration v2
+_PROMPT_COLUMNS = (
+    ("prompt_action", "TEXT"),
+    ("prompt_command", "TEXT"),
+    ("prompt_arguments", "TEXT"),
+    ("prompt_index", "INTEGER"),
+)
+
+# Index partiel couvrant : seuls les prompts actifs y figurent, et la
+# recherche du dernier prompt d'un chat se lit entièrement dans l'index
+_CREATE_ACTIVE_PROMPT_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_active_prompt
+    ON interactions (
+        chat_id, timestamp DESC,
+        prompt_action, prompt_command, prompt_arguments, prompt_index
+    )
+    WHERE is_prompt = 1 AND prompt_status = 'active'
+"""
+
+# Version du schéma, suivie dans PRAGMA user_version
+_SCHEMA_VERSION = 2
+
+# Migration v1 : les horodatages DATETIME (texte ISO en heure locale) deviennent
+# des entiers epoch UTC en nanosecondes (précision à la milliseconde)
+_MIGRATE_TIMESTAMPS_SQL = """
+    UPDATE interactions
+    SET timestamp = CAST(
+        (julianday(timestamp, 'utc') - 2440587.5) * 86400000 AS INTEGER
+    ) * 1000000
+    WHERE typeof(timestamp) = 'text'
+"""
+
+# Migration v2 : les champs des prompts existants sont recopiés de content
+_SELECT_PROMPT_CONTENTS_SQL = """
+    SELECT id, content FROM interactions
+    WHERE is_prompt = 1 AND prompt_action IS NULL
+"""
+
+_UPDATE_PROMPT_FIELDS_SQL = """
+    UPDATE interactions
+    SET prompt_action = ?, prompt_command = ?, prompt_arguments = ?, prompt_index = ?
+    WHERE id = ?
+"""
+
+_INSERT_INTERACTION_SQL = """
+    INSERT INTO interactions (timestamp, direction, chat_id, update_id, message_type, content)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_PROMPT_SQL = """
+    INSERT INTO interactions (
+        timestamp, direction, chat_id, message_type, content, is_prompt, prompt_status,
+        prompt_action, prompt_command, prompt_arguments, prompt_index
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_SELECT_ACTIVE_PROMPT_SQL = """
+    SELECT timestamp, id, prompt_action, prompt_command, prompt_arguments, prompt_index
+    FROM interactions
+    WHERE chat_id = ? AND is_prompt = 1 AND prompt_status = 'active'
+    ORDER BY timestamp DESC
+    LIMIT 1
+"""
+
+_UPDATE_RESOLVE_SQL = """
+    UPDATE interactions
+    SET prompt_status = 'resolved'
+    WHERE chat_id = ? AND is_prompt = 1 AND prompt_status = 'active'
+"""
+
+# Purge : seules les max_rows_per_chat dernières lignes d'un chat sont
+# conservées, hors prompts actifs
+_CREATE_CHAT_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_chat_id ON interactions (chat_id, id)
+"""
+
+_PRUNE_CHAT_SQL = """
+    DELETE FROM interactions
+    WHERE chat_id = ?
+      AND id <= (
+          SELECT id FROM interactions
+          WHERE chat_id = ?
+          ORDER BY id DESC
+          LIMIT 1 OFFSET ?
+      )
+      AND prompt_status IS NOT 'active'
+"""
+
+# UPDATE ... RETURNING est disponible à partir de SQLite 3.35
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+_POP_ACTIVE_PROMPTS_SQL = _UPDATE_RESOLVE_SQL + """
+    RETURNING timestamp, id, prompt_action, prompt_command, prompt_arguments, prompt_index
+"""
+
+
+def _dumps_prompt(
+        action: str, command: str, arguments: list, current_prompt_index: int
+) -> str:
+    """Sérialise le contenu d'un prompt en JSON compact."""
+    return json_dumps(
+        {
+            "action": action,
+            "command": command,
+            "arguments": arguments,
+            "current_prompt_index": current_prompt_index,
+        }
+    )
 
 
 class TelegramHistoryManager:
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, max_rows_per_chat: Optional[int] = None):
+        """
+        :param db_path: Chemin de la base SQLite (ou ":memory:").
+        :param max_rows_per_chat: Si renseigné, l'historique de chaque chat est
+            purgé périodiquement pour n'en garder que les dernières lignes.
+        """
         self.__db_path = db_path
+        self.__max_rows_per_chat = max_rows_per_chat
+        # Chats écrits depuis la dernière purge
+        self.__chats_to_prune: set = set()
+        self.__next_prune = time.monotonic() + _PRUNE_INTERVAL
+        # Connexion unique, partagée entre les threads du service et protégée
+        # par un verrou ; en autocommit (isolation_level=None) chaque
+        # instruction est validée immédiatement
+        self.__conn = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        self.__lock = threading.RLock()
         self._create_schema()
+        if max_rows_per_chat:
+            # Garde les purges par chat indexées (inutile sans purge)
+            with self.__lock:
+                self.__conn.execute(_CREATE_CHAT_INDEX_SQL)
+
+        # Les interactions sont écrites par lots par un thread dédié, hors du
+        # chemin critique de réception/envoi
+        self.__write_queue = queue.SimpleQueue()
+        self.__writer_thread = threading.Thread(
+            target=self._interaction_writer, name="tg-history", daemon=True
+        )
+        self.__writer_thread.start()
+        atexit.register(self.flush)
+
+    def close(self):
+        """Écrit les interactions en attente puis ferme la connexion."""
+        atexit.unregister(self.flush)
+        self.__write_queue.put(None)  # Signal d'arrêt du thread d'écriture
+        self.__writer_thread.join(timeout=5)
+        with self.__lock:
+            # Interactions journalisées après le signal d'arrêt
+            rows = self._take_rows()
+            if rows:
+                self._write_interactions(rows)
+            # Met à jour les statistiques du planificateur si nécessaire
+            self.__conn.execute("PRAGMA optimize")
+            self.__conn.close()
+
+    def flush(self, timeout: float = 5):
+        """Attend que les interactions journalisées jusqu'ici soient écrites."""
+        if self.__writer_thread.is_alive():
+            # La file est FIFO : le marqueur est atteint une fois tout ce qui
+            # le précède écrit
+            written = threading.Event()
+            self.__write_queue.put(written)
+            written.wait(timeout)
+
+    def _interaction_writer(self):
+        """Thread d'écriture : une transaction par lot d'interactions."""
+        while True:
+            item = self.__write_queue.get()
+            rows = []
+            markers = []
+            while item is not None:
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    rows.append(item)
+                if len(rows) >= _MAX_WRITE_BATCH:
+                    break
+                try:
+                    item = self.__write_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if rows:
+                try:
+                    self._write_interactions(rows)
+                    if self.__max_rows_per_chat:
+                        self._prune_if_due(rows)
+                except Exception as e:
+                    logger.exception("Error while writing history: %s", e)
+            for marker in markers:
+                marker.set()
+            if item is None:
+                return
+
+    def _prune_if_due(self, rows: list):
+        """Purge les chats écrits récemment, au plus une fois par intervalle."""
+        self.__chats_to_prune.update(row[2] for row in rows)
+        now = time.monotonic()
+        if now < self.__next_prune:
+            return
+        self.__next_prune = now + _PRUNE_INTERVAL
+        chat_ids, self.__chats_to_prune = self.__chats_to_prune, set()
+        keep = self.__max_rows_per_chat
+        with self.__lock:
+            with self.__conn:
+                self.__conn.execute("BEGIN")
+                self.__conn.executemany(
+                    _PRUNE_CHAT_SQL,
+                    ((chat_id, chat_id, keep) for chat_id in chat_ids),
+                )
+            # Rend au système l'espace du journal WAL
+            self.__conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _take_rows(self) -> list:
+        """Retire sans attendre les interactions restant dans la file."""
+        rows = []
+        while True:
+            try:
+                item = self.__write_queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if isinstance(item, tuple):
+                rows.append(item)
+
+    def _write_interactions(self, rows: list):
+        """Insère un lot d'interactions dans une seule transaction."""
+        with self.__lock, self.__conn:
+            self.__conn.execute("BEGIN")
+            self.__conn.executemany(_INSERT_INTERACTION_SQL, rows)
 
     def _create_schema(self):
-        """Crée la table pour l'historique si elle n'existe pas."""
-        with sqlite3.connect(self.__db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME NOT NULL,
-                    direction TEXT NOT NULL, -- 'incoming' or 'outgoing'
-                    chat_id INTEGER NOT NULL,
-                    update_id INTEGER, -- Uniquement pour 'incoming'
-                    message_type TEXT NOT NULL, -- 'text', 'callback_query'
-                    content TEXT NOT NULL, -- Le message/payload en JSON
-                    is_prompt BOOLEAN DEFAULT FALSE,
-                    prompt_status TEXT DEFAULT NULL -- 'active', 'resolved'
+        """
+        Règle la connexion et crée la table pour l'historique si elle n'existe
+        pas, en un seul script et une seule transaction.
+        """
+        script = _CONNECTION_PRAGMAS_SQL
+        if self.__db_path != ":memory:":
+            script = _WAL_PRAGMA_SQL + script
+        script += f"BEGIN;{_CREATE_TABLE_SQL};COMMIT;"
+        with self.__lock:
+            self.__conn.executescript(script)
+            self._migrate_schema()
+
+    def _migrate_schema(self):
+        """Met à niveau une base créée par une version antérieure."""
+        (version,) = self.__conn.execute("PRAGMA user_version").fetchone()
+        if version >= _SCHEMA_VERSION:
+            return
+        with self.__conn:
+            self.__conn.execute("BEGIN")
+            if version < 1:
+                self.__conn.execute(_MIGRATE_TIMESTAMPS_SQL)
+            if version < 2:
+                self._migrate_prompt_columns()
+            # L'index couvre les colonnes du prompt : créé une fois celles-ci
+            # présentes
+            self.__conn.execute(_CREATE_ACTIVE_PROMPT_INDEX_SQL)
+            self.__conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+
+    def _migrate_prompt_columns(self):
+        """Ajoute les colonnes du prompt et les remplit depuis content."""
+        existing = {
+            row[1] for row in self.__conn.execute("PRAGMA table_info(interactions)")
+        }
+        for name, sql_type in _PROMPT_COLUMNS:
+            if name not in existing:
+                self.__conn.execute(
+                    f"ALTER TABLE interactions ADD COLUMN {name} {sql_type}"
+                )
+        # L'ancien index couvrait content
+        self.__conn.execute("DROP INDEX IF EXISTS idx_active_prompt")
+        rows = []
+        for row_id, content_json in self.__conn.execute(_SELECT_PROMPT_CONTENTS_SQL):
+            content = json_loads(content_json)
+            rows.append(
+                (
+                    content["action"],
+                    content["command"],
+                    json_dumps(content["arguments"]),
+                    content.get("current_prompt_index", 0),
+                    row_id,
                 )
-            """
             )
-            conn.commit()
+        self.__conn.executemany(_UPDATE_PROMPT_FIELDS_SQL, rows)
 
     def log_interaction(
             self,
@@ -43,88 +353,95 @@ class TelegramHistoryManager:
             content: dict,
             update_id: Optional[int] = None,
     ):
-        """Journalise une interaction générique."""
-        with sqlite3.connect(self.__db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO interactions (timestamp, direction, chat_id, update_id, message_type, content)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    datetime.now(),
-                    direction,
-                    chat_id,
-                    update_id,
-                    message_type,
-                    json.dumps(content),
-                ),
+        """
+        Journalise une interaction générique.
+        L'écriture est différée : elle est faite par lot par le thread
+        d'écriture (voir flush() pour forcer l'écriture).
+        """
+        self.__write_queue.put(
+            (
+                time.time_ns(),
+                direction,
+                chat_id,
+                update_id,
+                message_type,
+                json_dumps(content),
             )
-            conn.commit()
+        )
 
     def log_prompt(self, prompt: CurrentPrompt, chat_id: int):
         """Journalise le début d'une commande interactive."""
         # noinspection PyUnresolvedReferences
-        content = {
-            "action": prompt.action,
-            "command": prompt.command.value,
-            "arguments": prompt.arguments,
-            "current_prompt_index": prompt.current_prompt_index,
-        }
-        with sqlite3.connect(self.__db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO interactions (timestamp, direction, chat_id, message_type, content, is_prompt, prompt_status)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
+        content = _dumps_prompt(
+            prompt.action,
+            prompt.command.value,
+            prompt.arguments,
+            prompt.current_prompt_index,
+        )
+        with self.__lock:
+            self.__conn.execute(
+                _INSERT_PROMPT_SQL,
                 (
-                    datetime.now(),
+                    time.time_ns(),
                     "system",
                     chat_id,
                     "prompt_start",
-                    json.dumps(content),
+                    content,
                     True,
                     "active",
+                    prompt.action,
+                    prompt.command.value,
+                    json_dumps(prompt.arguments),
+                    prompt.current_prompt_index,
                 ),
             )
-            conn.commit()
 
     def get_last_active_prompt(self, chat_id: int) -> Optional[CurrentPrompt]:
         """Récupère le dernier prompt actif pour un chat donné."""
-        with sqlite3.connect(self.__db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT content FROM interactions
-                WHERE chat_id = ? AND is_prompt = TRUE AND prompt_status = 'active'
-                ORDER BY timestamp DESC
-                LIMIT 1
-            """,
-                (chat_id,),
-            )
-            row = cursor.fetchone()
-            if row:
-                content = json.loads(row[0])
-                payload: DynamicEnumMember = Command.from_value(content["command"])
-                return CurrentPrompt(
-                    action=content["action"],
-                    command=payload,
-                    arguments=content["arguments"],
-                    current_prompt_index=content.get("current_prompt_index", 0),
-                )
-        return None
+        with self.__lock:
+            row = self.__conn.execute(
+                _SELECT_ACTIVE_PROMPT_SQL, (chat_id,)
+            ).fetchone()
+        return self._to_prompt(row) if row else None
+
+    def pop_active_prompt(self, chat_id: int) -> Optional[CurrentPrompt]:
+        """
+        Récupère le dernier prompt actif d'un chat et marque ses prompts
+        actifs comme résolus, en une seule instruction.
+        """
+        with self.__lock:
+            if _HAS_RETURNING:
+                rows = self.__conn.execute(
+                    _POP_ACTIVE_PROMPTS_SQL, (chat_id,)
+                ).fetchall()
+            else:
+                with self.__conn:
+                    self.__conn.execute("BEGIN")
+                    rows = self.__conn.execute(
+                        _SELECT_ACTIVE_PROMPT_SQL, (chat_id,)
+                    ).fetchall()
+                    self.__conn.execute(_UPDATE_RESOLVE_SQL, (chat_id,))
+        if not rows:
+            return None
+        # L'ordre des lignes de RETURNING n'est pas garanti
+        return self._to_prompt(max(rows))
+
+    @staticmethod
+    def _to_prompt(row: tuple) -> CurrentPrompt:
+        """
+        Reconstruit un prompt à partir d'une ligne (timestamp, id, action,
+        command, arguments, index) ; seuls les arguments sont décodés.
+        """
+        _, _, action, command, arguments, current_prompt_index = row
+        payload: DynamicEnumMember = Command.from_value(command)
+        return CurrentPrompt(
+            action=action,
+            command=payload,
+            arguments=json_loads(arguments),
+            current_prompt_index=current_prompt_index,
+        )
 
     def resolve_active_prompt(self, chat_id: int):
         """Marque le prompt actif comme résolu."""
-        with sqlite3.connect(self.__db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                UPDATE interactions
-                SET prompt_status = 'resolved'
-                WHERE chat_id = ? AND prompt_status = 'active'
-            """,
-                (chat_id,),
-            )
-            conn.commit()
+        with self.__lock:
+            self.__conn.execute(_UPDATE_RESOLVE_SQL, (chat_id,))
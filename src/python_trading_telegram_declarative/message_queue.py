@@ -1,15 +1,131 @@
-import json
+import hmac
+import logging
 import queue
+import secrets
 import threading
 import time
-from typing import List, Union
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Sequence, Union
+from urllib.parse import urlsplit
 
 from python_trading_telegram_declarative.classes.payload import TelegramPayload
 from python_trading_telegram_declarative.client import (TelegramAPIError, TelegramClient,
                                       TelegramNetworkError)
 from python_trading_telegram_declarative.history import TelegramHistoryManager
 from python_trading_telegram_declarative.tools.logger import logger
-from python_trading_telegram_declarative.tools.utils import ensure_list, is_empty_or_none
+from python_trading_telegram_declarative.tools.utils import json_dumps, json_loads
+
+# Sentinel pushed on the outgoing queue to wake up and stop the sender thread
+_STOP = object()
+
+# Maximum number of pending messages drained by the sender per wake-up
+_MAX_BATCH = 32
+
+# Telegram's maximum length of a message text
+_MAX_TEXT_LENGTH = 4096
+
+# Values of text/reply_markup counting as no content (see is_empty_or_none)
+_NO_CONTENT = (None, "")
+
+# How often the webhook server checks for shutdown (the stdlib default): bounds
+# the latency of stop() against idle wake-ups
+_SHUTDOWN_POLL_INTERVAL = 0.5
+
+# Number of recent update_ids remembered to skip Telegram's redeliveries
+_MAX_SEEN_UPDATES = 512
+
+# Largest webhook request body accepted; Telegram updates are a few KB at most
+_MAX_WEBHOOK_BODY = 1 << 20
+
+
+class _LazyJson:
+    """Defers JSON serialization of a logged object until the record is emitted."""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return json_dumps(self.obj)
+
+
+class _RecentUpdateIds:
+    """
+    Bounded set of the most recent update_ids, used to skip redeliveries.
+    Ids are not compared by order: after a week without updates, Telegram
+    picks the next one at random, possibly lower than the previous ones.
+    Not thread-safe: callers serialize access.
+    """
+
+    __slots__ = ("__ids", "__max_size")
+
+    def __init__(self, max_size: int = _MAX_SEEN_UPDATES):
+        self.__ids: OrderedDict = OrderedDict()
+        self.__max_size = max_size
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self.__ids
+
+    def add(self, update_id: int):
+        """Remembers an update_id, forgetting the oldest one beyond max_size."""
+        self.__ids[update_id] = None
+        if len(self.__ids) > self.__max_size:
+            self.__ids.popitem(last=False)
+
+
+class RateLimiter:
+    """
+    Token buckets enforcing Telegram's sending limits: per_chat_rate messages
+    per second in a given chat and global_rate messages per second overall.
+    """
+
+    def __init__(
+            self,
+            per_chat_rate: float = 1.0,
+            global_rate: float = 30.0,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.__per_chat_rate = per_chat_rate
+        self.__global_rate = global_rate
+        self.__clock = clock
+        # chat_id -> (tokens, last refill time)
+        self.__chat_buckets: dict = {}
+        self.__global_bucket = (max(1.0, global_rate), clock())
+
+    def acquire(self, chat_id) -> float:
+        """
+        Takes a token for a message to chat_id. Returns 0 when the message can
+        be sent now, otherwise the delay in seconds before asking again (no
+        token is taken then).
+        """
+        now = self.__clock()
+        chat_tokens = self._refill(
+            self.__chat_buckets.get(chat_id), self.__per_chat_rate, now
+        )
+        global_tokens = self._refill(self.__global_bucket, self.__global_rate, now)
+        if chat_tokens >= 1 and global_tokens >= 1:
+            chat_tokens -= 1
+            global_tokens -= 1
+            wait = 0.0
+        else:
+            wait = max(
+                (1 - chat_tokens) / self.__per_chat_rate,
+                (1 - global_tokens) / self.__global_rate,
+            )
+        self.__chat_buckets[chat_id] = (chat_tokens, now)
+        self.__global_bucket = (global_tokens, now)
+        return wait
+
+    @staticmethod
+    def _refill(bucket: Optional[tuple], rate: float, now: float) -> float:
+        """Tokens in a bucket at time now; a bucket holds up to one second of rate."""
+        capacity = max(1.0, rate)
+        if bucket is None:
+            return capacity
+        tokens, last_refill = bucket
+        return min(capacity, tokens + (now - last_refill) * rate)
 
 
 class MessageSender:
@@ -23,11 +139,22 @@ class MessageSender:
             client: TelegramClient,
             chat_id: str,
             history_manager: TelegramHistoryManager,
+            rate_limiter: Optional[RateLimiter] = None,
+            coalesce_text: bool = False,
     ):
+        """
+        :param rate_limiter: Paces the sender thread to Telegram's limits
+            instead of relying on 429 retries (default: no pacing).
+        :param coalesce_text: Merges consecutive plain-text messages waiting in
+            the queue into as few messages as possible (up to 4096 characters).
+        """
         self.__client = client
+        self.__coalesce_text = coalesce_text
         self.__chat_id = chat_id
+        self.__rate_limiter = rate_limiter
         self.__history_manager = history_manager
-        self.__outgoing_queue = queue.Queue()
+        # C-implemented unbounded FIFO: no Condition/task tracking on put/get
+        self.__outgoing_queue = queue.SimpleQueue()
         self.__sender_thread = None
         self.__stop_event = threading.Event()
 
@@ -36,7 +163,7 @@ class MessageSender:
         if self.__sender_thread is None or not self.__sender_thread.is_alive():
             self.__stop_event.clear()
             self.__sender_thread = threading.Thread(
-                target=self._message_sender, daemon=True
+                target=self._message_sender, name="tg-sender", daemon=True
             )
             self.__sender_thread.start()
             logger.info("MessageSender started")
@@ -45,14 +172,18 @@ class MessageSender:
         """Stops the sender thread cleanly."""
         logger.info("Stopping MessageSender")
         self.__stop_event.set()
-        self.flush_queue()
+        self.__outgoing_queue.put(_STOP)  # Stop signal
         if self.__sender_thread and self.__sender_thread.is_alive():
             self.__sender_thread.join(timeout=5)
+        self.flush_queue()
         logger.info("MessageSender stopped")
 
     def send_message(self, messages: Union[TelegramPayload, List[TelegramPayload]]):
         """Adds one or more messages to the outgoing queue."""
-        for message in ensure_list(messages):
+        # Single payload: the common case, handled without calling ensure_list
+        if not isinstance(messages, list):
+            messages = (messages,)
+        for message in messages:
             if self._is_valid_message(message):
                 self.__outgoing_queue.put(message)
             else:
@@ -61,49 +192,106 @@ class MessageSender:
     def flush_queue(self):
         """Immediately empties the outgoing queue."""
         logger.info("Immediate flush of outgoing queue")
+        messages = []
         while not self.__outgoing_queue.empty():
             try:
                 message = self.__outgoing_queue.get_nowait()
-                self.__outgoing_queue.task_done()
-                if self._is_valid_message(message):
-                    payload = self._build_payload(message)
-                    self._send_payload(payload)
-                else:
-                    logger.warning(
-                        "Message without text content or markup: %s", message
-                    )
             except queue.Empty:
                 break
+            if message is not _STOP:
+                messages.append(message)
+        for payload in self._payloads(messages):
+            self._send_payload(payload)
 
     def _message_sender(self):
         """Message sending thread."""
         logger.info("Starting message sending thread")
-        while not self.__stop_event.is_set():
-            try:
-                message = self.__outgoing_queue.get(timeout=0.1)
-                self.__outgoing_queue.task_done()
-
-                if not message:
-                    continue
+        while True:
+            batch = self._next_batch()
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
 
-                if self._is_valid_message(message):
-                    payload = self._build_payload(message)
-                    logger.info("Sending message: %s", json.dumps(payload))
+            for payload in self._payloads(batch):
+                try:
+                    self._throttle(payload["chat_id"])
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("Sending message: %s", _LazyJson(payload))
                     self._send_payload(payload)
-                else:
-                    logger.warning(
-                        "Message without text content or markup: %s", message
-                    )
+                except (TelegramAPIError, TelegramNetworkError) as e:
+                    logger.error(f"Telegram error during sending: {e}")
+                except Exception as e:
+                    logger.exception(f"Unexpected error in MessageSender: %s", e)
 
+            if stopping:
+                return
+
+    def _payloads(self, messages: list):
+        """
+        Yields the payloads to send for queued messages, merging consecutive
+        plain-text messages when coalesce_text is enabled.
+        Messages are validated by send_message before being queued.
+        """
+        if not self.__coalesce_text:
+            for message in messages:
+                yield self._build_payload(message)
+            return
+
+        texts = []
+        length = 0
+        for message in messages:
+            text = message.get("text")
+            # Only messages made of a text alone can be merged
+            mergeable = (
+                    isinstance(text, str)
+                    and message.keys() <= {"text", "reply_markup"}
+                    and not message.get("reply_markup")
+            )
+            if texts and (
+                    not mergeable or length + 1 + len(text) > _MAX_TEXT_LENGTH
+            ):
+                yield self._build_payload({"text": "\n".join(texts)})
+                texts = []
+            if mergeable:
+                length = len(text) if not texts else length + 1 + len(text)
+                texts.append(text)
+            else:
+                yield self._build_payload(message)
+        if texts:
+            yield self._build_payload({"text": "\n".join(texts)})
+
+    def _throttle(self, chat_id):
+        """
+        Waits until the rate limiter lets a message to chat_id through.
+        The wait is cut short by stop(): pending messages are then sent at once.
+        """
+        if self.__rate_limiter is None:
+            return
+        wait = self.__rate_limiter.acquire(chat_id)
+        while wait > 0:
+            if self.__stop_event.wait(wait):
+                return
+            wait = self.__rate_limiter.acquire(chat_id)
+
+    def _next_batch(self) -> list:
+        """
+        Blocks until a message is available, then drains the pending ones
+        without blocking (up to _MAX_BATCH). Draining stops at the stop signal
+        so that messages enqueued after it are left for flush_queue.
+        """
+        batch = [self.__outgoing_queue.get()]
+        while batch[-1] is not _STOP and len(batch) < _MAX_BATCH:
+            try:
+                batch.append(self.__outgoing_queue.get_nowait())
             except queue.Empty:
-                time.sleep(0.1)
-            except (TelegramAPIError, TelegramNetworkError) as e:
-                logger.error(f"Telegram error during sending: {e}")
-            except Exception as e:
-                logger.exception(f"Unexpected error in MessageSender: %s", e)
+                break
+        return batch
 
     def _build_payload(self, message: TelegramPayload) -> dict:
-        """Builds a payload for the Telegram API."""
+        """
+        Builds a payload for the Telegram API from the fields TelegramPayload
+        declares: other keys, a chat_id included, are not forwarded.
+        """
         return {
             "chat_id": self.__chat_id,
             "text": message.get("text", ""),
@@ -111,18 +299,29 @@ class MessageSender:
         }
 
     def _send_payload(self, payload: dict):
-        """Sends a payload and logs the interaction."""
+        """
+        Sends a payload and logs the interaction.
+        Still rate limited after the client's own retries, the payload is sent
+        once more after the delay requested by Telegram, unless stop() is called.
+        """
         self.__history_manager.log_interaction(
             "outgoing", payload["chat_id"], "message", payload
         )
-        self.__client.send_message(payload)
+        try:
+            self.__client.send_message(payload)
+        except TelegramAPIError as e:
+            if e.retry_after is None or self.__stop_event.wait(e.retry_after):
+                raise
+            self.__client.send_message(payload)
 
     # noinspection PyTypedDict
     @staticmethod
     def _is_valid_message(message: TelegramPayload) -> bool:
         """Checks if a message contains valid content."""
-        return message and any(
-            not is_empty_or_none(message.get(key)) for key in ["text", "reply_markup"]
+        # Unrolled over the two content fields: no generator per message
+        return bool(message) and (
+            message.get("text") not in _NO_CONTENT
+            or message.get("reply_markup") not in _NO_CONTENT
         )
 
     # Test helpers - for testing purposes only
@@ -133,6 +332,7 @@ class MessageSender:
             "outgoing_queue": self.__outgoing_queue,
             "sender_thread": self.__sender_thread,
             "stop_event": self.__stop_event,
+            "rate_limiter": self.__rate_limiter,
         }
 
 
@@ -142,17 +342,36 @@ class MessageReceiver:
     Single responsibility: retrieving Telegram updates.
     """
 
-    def __init__(self, client: TelegramClient, history_manager: TelegramHistoryManager):
+    def __init__(
+            self,
+            client: TelegramClient,
+            history_manager: TelegramHistoryManager,
+            allowed_updates: Optional[Sequence[str]] = None,
+    ):
+        """
+        :param allowed_updates: Update types Telegram should send, e.g.
+            ["message", "callback_query"]. By default the parameter is not
+            sent and Telegram keeps its own setting.
+        """
         self.__client = client
         self.__history_manager = history_manager
         self.__last_update_id = None
+        self.__seen_updates = _RecentUpdateIds()
+        # getUpdates parameters, reused by every poll (only the offset changes)
+        self.__poll_params = {"timeout": 30}
+        if allowed_updates is not None:
+            self.__poll_params["allowed_updates"] = json_dumps(list(allowed_updates))
         self.__incoming_queue = queue.Queue()
         self.__receiver_thread = None
         self.__stop_event = threading.Event()
 
     @property
     def incoming_queue(self) -> queue.Queue:
-        """Access to the incoming messages queue."""
+        """
+        Access to the incoming messages queue.
+        Items are (update, chat_id, message_type, content) tuples, already
+        parsed by parse_update; None is the stop signal.
+        """
         return self.__incoming_queue
 
     def start(self):
@@ -160,7 +379,7 @@ class MessageReceiver:
         if self.__receiver_thread is None or not self.__receiver_thread.is_alive():
             self.__stop_event.clear()
             self.__receiver_thread = threading.Thread(
-                target=self._message_receiver, daemon=True
+                target=self._message_receiver, name="tg-receiver", daemon=True
             )
             self.__receiver_thread.start()
             logger.info("MessageReceiver started")
@@ -179,49 +398,67 @@ class MessageReceiver:
         logger.info("Starting message reception thread")
         while not self.__stop_event.is_set():
             try:
-                params = {"timeout": 30}
+                params = self.__poll_params
                 if self.__last_update_id is not None:
                     params["offset"] = self.__last_update_id + 1
 
                 updates = self.__client.get_updates(params)
-                logger.info("Updates received: %s", json.dumps(updates))
-
-                for update in updates.get("result", []):
-                    self.__last_update_id = update.get("update_id")
-                    chat_id, message_type, content = self.parse_update(update)
-                    if chat_id:
-                        self.__history_manager.log_interaction(
-                            "incoming",
-                            chat_id,
-                            message_type,
-                            content,
-                            update.get("update_id"),
-                        )
-                    self.__incoming_queue.put(update)
+                logger.info("Updates received: %s", _LazyJson(updates))
+
+                # Empty polls are the common case: no default list allocated
+                result = updates.get("result")
+                if result:
+                    self._queue_updates(result)
 
             except TelegramNetworkError as e:
                 logger.warning("Network error in MessageReceiver: %s", e)
-                time.sleep(3)
+                # Back off, but wake up at once if the receiver is stopped
+                self.__stop_event.wait(3)
             except Exception as e:
                 logger.exception(f"Unexpected error in MessageReceiver: %s", e)
-                time.sleep(1)
+                self.__stop_event.wait(1)
+
+    def _queue_updates(self, updates: list):
+        """
+        Logs and queues a batch of up to 100 updates.
+        Lookups are bound once per batch rather than once per update.
+        """
+        parse_update = self.parse_update
+        log_interaction = self.__history_manager.log_interaction
+        put = self.__incoming_queue.put
+        seen_updates = self.__seen_updates
+        for update in updates:
+            update_id = update["update_id"]
+            if update_id not in seen_updates:
+                chat_id, message_type, content = parse_update(update)
+                if chat_id:
+                    log_interaction("incoming", chat_id, message_type, content, update_id)
+                put((update, chat_id, message_type, content))
+                # Recorded once queued: an update failing before is not lost
+                seen_updates.add(update_id)
+            # Confirmed to Telegram by the next offset
+            self.__last_update_id = update_id
 
     @staticmethod
     def parse_update(update: dict) -> tuple[int | None, str, dict]:
-        """Parses a Telegram update."""
-        if "message" in update and "text" in update.get("message", {}):
-            chat_id = update.get("message", {}).get("chat", {}).get("id")
-            content = {"text": update["message"]["text"]}
-            return chat_id, "text", content
-        elif "callback_query" in update:
-            chat_id = (
-                update.get("callback_query", {})
-                .get("message", {})
-                .get("chat", {})
-                .get("id")
-            )
-            content = {"data": update["callback_query"]["data"]}
-            return chat_id, "callback_query", content
+        """
+        Parses a Telegram update.
+        Valid updates always carry the chat of their message, so fields are
+        read by direct subscript; malformed updates are reported as unknown.
+        """
+        try:
+            message = update.get("message")
+            if message is not None and "text" in message:
+                return message["chat"]["id"], "text", {"text": message["text"]}
+            callback_query = update.get("callback_query")
+            if callback_query is not None:
+                return (
+                    callback_query["message"]["chat"]["id"],
+                    "callback_query",
+                    {"data": callback_query["data"]},
+                )
+        except (KeyError, TypeError):
+            pass
         return None, "unknown", update
 
     # Test helpers - for testing purposes only
@@ -233,3 +470,187 @@ class MessageReceiver:
             "receiver_thread": self.__receiver_thread,
             "stop_event": self.__stop_event,
         }
+
+
+class WebhookReceiver:
+    """
+    Receives updates pushed by Telegram to a webhook, as an alternative to
+    MessageReceiver's long polling: same incoming queue, no polling loop.
+    The HTTP server is meant to sit behind a TLS-terminating reverse proxy.
+    """
+
+    def __init__(
+            self,
+            client: TelegramClient,
+            history_manager: TelegramHistoryManager,
+            url: str,
+            listen: tuple[str, int] = ("127.0.0.1", 8080),
+            secret_token: Optional[str] = None,
+            poll_interval: float = _SHUTDOWN_POLL_INTERVAL,
+            allowed_updates: Optional[Sequence[str]] = None,
+    ):
+        """
+        :param url: Public HTTPS URL registered with Telegram; requests to
+            another path are refused.
+        :param listen: Local (host, port) of the HTTP server, by default only
+            reachable by a reverse proxy on the same host.
+        :param secret_token: Checked against the
+            X-Telegram-Bot-Api-Secret-Token header of every request. A random
+            one is generated when not given.
+        :param poll_interval: Seconds between the server's shutdown checks,
+            the longest stop() waits for the server.
+        :param allowed_updates: Update types Telegram should push, as for
+            MessageReceiver. By default Telegram keeps its own setting.
+        """
+        self.__client = client
+        self.__history_manager = history_manager
+        self.__url = url
+        self.__path = urlsplit(url).path or "/"
+        self.__listen = listen
+        self.__poll_interval = poll_interval
+        self.__allowed_updates = (
+            json_dumps(list(allowed_updates)) if allowed_updates is not None else None
+        )
+        # Without a secret, anyone reaching the server could forge updates
+        self.__secret_token = secret_token or secrets.token_urlsafe(32)
+        self.__seen_updates = _RecentUpdateIds()
+        self.__incoming_queue = queue.Queue()
+        self.__server = None
+        self.__server_thread = None
+        self.__register_thread = None
+        # Telegram may deliver an update again until it gets a 200: checking
+        # and recording an update_id must not interleave between requests
+        self.__update_lock = threading.Lock()
+
+    @property
+    def incoming_queue(self) -> queue.Queue:
+        """
+        Access to the incoming messages queue.
+        Items are (update, chat_id, message_type, content) tuples, already
+        parsed by parse_update; None is the stop signal.
+        """
+        return self.__incoming_queue
+
+    parse_update = staticmethod(MessageReceiver.parse_update)
+
+    def start(self):
+        """
+        Starts the HTTP server, then registers the webhook in the background:
+        start() does not block on the network.
+        """
+        if self.__server_thread is None or not self.__server_thread.is_alive():
+            self.__server = ThreadingHTTPServer(self.__listen, self._request_handler())
+            self.__server_thread = threading.Thread(
+                target=self.__server.serve_forever,
+                args=(self.__poll_interval,),
+                name="tg-receiver",
+                daemon=True,
+            )
+            self.__server_thread.start()
+            self.__register_thread = threading.Thread(
+                target=self._register_webhook, name="tg-webhook", daemon=True
+            )
+            self.__register_thread.start()
+            logger.info("WebhookReceiver started on %s:%s", *self.__server.server_address[:2])
+
+    def stop(self):
+        """Removes the webhook and stops the HTTP server."""
+        logger.info("Stopping WebhookReceiver")
+        if self.__server is not None:
+            # The registration must not land after the deletion
+            self.__register_thread.join()
+            try:
+                self.__client.delete_webhook()
+            except (TelegramAPIError, TelegramNetworkError) as e:
+                logger.warning("Could not delete webhook: %s", e)
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        self.__incoming_queue.put(None)  # Stop signal
+        logger.info("WebhookReceiver stopped")
+
+    def _register_webhook(self):
+        """Registers the webhook, after which Telegram pushes the updates."""
+        try:
+            self.__client.set_webhook(
+                self.__url, self.__secret_token, self.__allowed_updates
+            )
+        except (TelegramAPIError, TelegramNetworkError) as e:
+            logger.error("Could not register webhook: %s", e)
+
+    def _request_handler(self) -> type:
+        """Builds the request handler class bound to this receiver."""
+        receiver = self
+
+        class _WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if urlsplit(self.path).path != receiver.path:
+                    self.send_error(404)
+                    return
+                if not receiver._is_authorized(
+                        self.headers.get("X-Telegram-Bot-Api-Secret-Token")
+                ):
+                    self.send_error(403)
+                    return
+                try:
+                    length = int(self.headers["Content-Length"])
+                except (KeyError, TypeError, ValueError):
+                    self.send_error(411)
+                    return
+                if not 0 <= length <= _MAX_WEBHOOK_BODY:
+                    self.send_error(413)
+                    return
+                try:
+                    update = json_loads(self.rfile.read(length))
+                    receiver._handle_update(update)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning("Invalid webhook update: %s", e)
+                    self.send_error(400)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug("Webhook request: " + format, *args)
+
+        return _WebhookHandler
+
+    @property
+    def path(self) -> str:
+        """Path of the webhook URL, the only one served."""
+        return self.__path
+
+    def _is_authorized(self, secret_token: Optional[str]) -> bool:
+        """Checks the secret token sent by Telegram."""
+        return secret_token is not None and hmac.compare_digest(
+            secret_token.encode(), self.__secret_token.encode()
+        )
+
+    def _handle_update(self, update: dict):
+        """
+        Logs and queues a pushed update, skipping redeliveries.
+        The update_id is recorded once queued: if handling fails, Telegram's
+        redelivery is processed instead of dropped.
+        """
+        update_id = update["update_id"]
+        with self.__update_lock:
+            if update_id in self.__seen_updates:
+                return
+            chat_id, message_type, content = self.parse_update(update)
+            if chat_id:
+                self.__history_manager.log_interaction(
+                    "incoming", chat_id, message_type, content, update_id
+                )
+            self.__incoming_queue.put((update, chat_id, message_type, content))
+            self.__seen_updates.add(update_id)
+
+    # Test helpers - for testing purposes only
+    def _get_test_attributes(self) -> dict:
+        """Get internal attributes for testing. Not for production use."""
+        return {
+            "incoming_queue": self.__incoming_queue,
+            "server": self.__server,
+            "server_thread": self.__server_thread,
+            "register_thread": self.__register_thread,
+        }
@@ -1,7 +1,7 @@
-import json
+import logging
 import queue
-import time
-from typing import Callable, Union
+import threading
+from typing import Callable, Optional, Sequence, Union
 
 from python_trading_telegram_declarative.base import BaseService
 from python_trading_telegram_declarative.classes.command import Command
@@ -11,8 +11,9 @@ from python_trading_telegram_declarative.classes.payload import TelegramPayload
 from python_trading_telegram_declarative.classes.types import CurrentPrompt
 from python_trading_telegram_declarative.handler import TelegramHandler
 from python_trading_telegram_declarative.history import TelegramHistoryManager
+from python_trading_telegram_declarative.message_queue import RateLimiter
 from python_trading_telegram_declarative.tools.logger import logger
-from python_trading_telegram_declarative.tools.utils import truncate_text
+from python_trading_telegram_declarative.tools.utils import batched, json_dumps, truncate_text
 
 CommandsHandlers = list[Callable[[Command], str]]
 
@@ -22,6 +23,8 @@ class TelegramNotificationService(BaseService):
     Orchestrates Telegram command and interaction management.
     """
 
+    _INTERACTIVE_PROMPTS: frozenset[str] = frozenset(("ask", "respond"))
+
     def __init__(
             self,
             api_base_url,
@@ -29,11 +32,38 @@ class TelegramNotificationService(BaseService):
             chat_id,
             endpoints,
             history_manager: TelegramHistoryManager,
+            max_workers: int = 1,
+            allowed_updates: Optional[Sequence[str]] = None,
+            rate_limiter: Optional[RateLimiter] = None,
     ):
-        super().__init__(api_base_url, bot_token, chat_id, endpoints, history_manager)
+        """
+        :param max_workers: Number of threads processing updates. Updates of a
+            given chat are always processed by the same thread, in order; with
+            more than one, handlers must be thread-safe.
+        :param allowed_updates: Update types Telegram should deliver, see
+            TelegramService. Only messages and callback queries are handled.
+        :param rate_limiter: Paces outgoing messages (default: no pacing).
+        """
+        # Read by process_commands, which BaseService starts from __init__
+        self._max_workers = max(1, max_workers)
+        super().__init__(
+            api_base_url,
+            bot_token,
+            chat_id,
+            endpoints,
+            history_manager,
+            allowed_updates,
+            rate_limiter,
+        )
         self._history_manager = history_manager
-        self._interactive_prompts = ["ask", "respond"]
         self._telegram_handlers: list[TelegramHandler] = []
+        # Lookup tables rebuilt whenever the handler list changes
+        self._command_index: dict = {}
+        self._command_handlers: dict = {}
+        self._menu_index: dict = {}
+        # Keyboard payloads built along with the indexes
+        self._help_payload: list[TelegramPayload] = self.menu_keyboard([])
+        self._menu_payloads: dict = {}
         logger.info("Telegram service initialized with chat_id=%s", chat_id)
 
     # noinspection PyMethodMayBeStatic
@@ -44,20 +74,17 @@ class TelegramNotificationService(BaseService):
         Displays a help menu with available commands as interactive buttons.
         """
         # noinspection PyUnresolvedReferences
-        buttons = [
+        buttons = (
             {
                 "text": truncate_text(cmd.name.replace("_", " ").capitalize(), 14),
                 "callback_data": cmd.value,
             }
             for cmd in commands
-        ]
-        inline_keyboard = [
-            buttons[i: i + items_per_line]
-            for i in range(0, len(buttons), items_per_line)
-        ]
+        )
+        inline_keyboard = [list(row) for row in batched(buttons, items_per_line)]
         keyboard: TelegramPayload = {
             "text": "Here are the available commands:",
-            "reply_markup": json.dumps({"inline_keyboard": inline_keyboard}),
+            "reply_markup": json_dumps({"inline_keyboard": inline_keyboard}),
         }
         return [keyboard]
 
@@ -74,56 +101,130 @@ class TelegramNotificationService(BaseService):
         else:
             self._telegram_handlers = []
             logger.info("Handlers reset")
+        self._rebuild_index()
+
+    def refresh_handlers(self):
+        """
+        Re-reads the command_actions of the registered handlers. Call it after
+        a handler changed its commands: dispatch and keyboards are otherwise
+        built once, when the handler is added.
+        """
+        for handler in self._telegram_handlers:
+            handler.refresh_actions()
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        """
+        Indexes the command actions and menus of all handlers.
+        The first handler declaring a command wins, menus are merged.
+        """
+        command_index = {}
+        command_handlers = {}
+        menu_index = {}
+        for handler in self._telegram_handlers:
+            for menu, actions in handler.command_actions.items():
+                menu_index.setdefault(menu, {}).update(actions)
+                for command, action in actions.items():
+                    command_index.setdefault(command, action)
+                    handlers = command_handlers.setdefault(command, [])
+                    if handler not in handlers:
+                        handlers.append(handler)
+        self._command_index = command_index
+        self._command_handlers = command_handlers
+        self._menu_index = menu_index
+        self._build_keyboards()
+
+    def _build_keyboards(self):
+        """
+        Builds the /help and menu keyboards once per handler change, so that
+        answering a menu request is a dictionary lookup.
+        """
+        # Menus are already merged across handlers by the menu index; members
+        # compare equal to their value, which avoids creating a /none member
+        # before the handlers register their enums
+        self._help_payload = self.menu_keyboard(
+            [menu for menu in self._menu_index if menu != "/none"]
+        )
+        self._menu_payloads = {
+            menu: self.menu_keyboard(list(actions))
+            for menu, actions in self._menu_index.items()
+        }
 
     def _search_in_handlers(self, command_key: Command) -> dict:
         """Searches for an action associated with a command in the handlers."""
-        for handler in self._telegram_handlers:
-            for _, value in handler.command_actions.items():
-                if command_key in value:
-                    # logger.debug("Command found: %s in handler %s", command_key, handler.__class__.__name__)
-                    return value.get(command_key, {})
-        # logger.debug("Command not found: %s", command_key)
-        return {}
+        return self._command_index.get(command_key, {})
 
     def process_commands(self):
         """Processes commands from the incoming queue."""
         logger.info("Starting command processing")
+        workers = self._start_workers() if self._max_workers > 1 else []
         while True:
-            try:
-                update = self.incoming_queue.get(timeout=0.1)
-                self.incoming_queue.task_done()
-                if update is None:
-                    logger.info("Stop signal received, ending command processing")
-                    break
-
-                # logger.debug("Update received: %s", update)
-                messages: list[TelegramPayload] = []
-                chat_id, msg_type, content = self.parse_update(update)
-
-                if not chat_id:
-                    logger.warning("No chat_id found in update: %s", update)
-                    continue
-
-                if msg_type == "text":
-                    # logger.debug("Traitement d'un message texte: %s", content['text'])
-                    messages = self._handle_text_message(content["text"], chat_id)
-                elif msg_type == "callback_query":
-                    # logger.debug("Traitement d'une callback_query: %s", content)
-                    messages = self._handle_callback_query(update, chat_id)
-                else:
-                    logger.warning("Unknown message type: %s", msg_type)
+            item = self.incoming_queue.get()  # Blocks until an update arrives
+            self.incoming_queue.task_done()
+            if item is None:
+                logger.info("Stop signal received, ending command processing")
+                break
+            if workers:
+                # Same chat, same worker: the updates of a chat stay ordered
+                workers[hash(item[1]) % len(workers)][0].put(item)
+            else:
+                self._process_update(item)
+
+        for updates, _ in workers:
+            updates.put(None)
+        for _, thread in workers:
+            thread.join(timeout=5)
+
+    def _start_workers(self) -> list[tuple[queue.SimpleQueue, threading.Thread]]:
+        """Starts the update processing threads, each with its own queue."""
+        workers = []
+        for index in range(self._max_workers):
+            updates = queue.SimpleQueue()
+            thread = threading.Thread(
+                target=self._process_worker_updates,
+                args=(updates,),
+                name=f"tg-worker-{index}",
+                daemon=True,
+            )
+            thread.start()
+            workers.append((updates, thread))
+        return workers
+
+    def _process_worker_updates(self, updates: queue.SimpleQueue):
+        """Worker thread: processes the updates routed to it until None."""
+        while (item := updates.get()) is not None:
+            self._process_update(item)
+
+    def _process_update(self, item: tuple):
+        """Processes one (update, chat_id, message_type, content) item."""
+        try:
+            # Updates are parsed once by the receiver
+            update, chat_id, msg_type, content = item
+            # logger.debug("Update received: %s", update)
+            messages: list[TelegramPayload] = []
 
-                if messages:
+            if not chat_id:
+                logger.warning("No chat_id found in update: %s", update)
+                return
+
+            if msg_type == "text":
+                # logger.debug("Traitement d'un message texte: %s", content['text'])
+                messages = self._handle_text_message(content["text"], chat_id)
+            elif msg_type == "callback_query":
+                # logger.debug("Traitement d'une callback_query: %s", content)
+                messages = self._handle_callback_query(update, chat_id)
+            else:
+                logger.warning("Unknown message type: %s", msg_type)
+
+            if messages:
+                if logger.isEnabledFor(logging.DEBUG):
                     logger.debug("Sending messages: %s", messages)
-                    self.send_message(messages)
-                else:
-                    logger.debug("No message to send for this update")
+                self.send_message(messages)
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug("No message to send for this update")
 
-            except queue.Empty:
-                # logger.debug("No update in queue")
-                time.sleep(0.1)
-            except Exception as e:
-                logger.exception(f"Error during command processing: %s", e)
+        except Exception as e:
+            logger.exception(f"Error during command processing: %s", e)
 
     def _handle_callback_query(
             self, update: dict, chat_id: int
@@ -132,19 +233,17 @@ class TelegramNotificationService(BaseService):
         action, enum, arguments = self.parse_command(update)
         # logger.debug("Callback query: action=%s, enum=%s, arguments=%s", action, enum, arguments)
 
-        if action in self._interactive_prompts:
+        if action in self._INTERACTIVE_PROMPTS:
             return self._process_interactive_prompt(action, enum, arguments, chat_id)
         else:
             if enum and enum.parent_enum == Command:
                 return self._execute_command(enum, arguments, chat_id)
             elif enum and enum.parent_enum == Menu:
-                sub_menu_actions = {}
-                for handler in self._telegram_handlers:
-                    for menu, actions in handler.command_actions.items():
-                        if enum == menu:
-                            sub_menu_actions.update(actions)
-                # logger.debug("Menu displayed: %s", sub_menu_actions.keys())
-                return self.menu_keyboard(list(sub_menu_actions.keys()))
+                payload = self._menu_payloads.get(enum)
+                if payload is None:
+                    # Menu declared by no handler: empty keyboard
+                    payload = self.menu_keyboard([])
+                return payload
             else:
                 logger.warning(f"Unrecognized enum type or enum is None: %s", enum)
                 return []
@@ -154,20 +253,19 @@ class TelegramNotificationService(BaseService):
         """Processes a received text message."""
         # logger.debug("Text message received: %s", text)
         if text == "/help":  # Direct comparison with command value
-            top_menu = []
-            for handler in self._telegram_handlers:
-                for menu in handler.command_actions:
-                    if menu != Menu.from_value("/none"):
-                        top_menu.append(menu)
-            # logger.debug("Affichage du menu principal: %s", top_menu)
-            return self.menu_keyboard(top_menu)
+            return self._help_payload
 
+        # Read only: the prompt stays active until its answer is processed
         current_prompt = self._history_manager.get_last_active_prompt(chat_id)
         if current_prompt and current_prompt.action == "ask":
             # logger.debug("Interactive prompt detected: %s", current_prompt)
             current_prompt.arguments.append(text)
             return self._process_interactive_prompt(
-                "respond", current_prompt.command, current_prompt.arguments, chat_id
+                "respond",
+                current_prompt.command,
+                current_prompt.arguments,
+                chat_id,
+                current_prompt,
             )
 
         return []
@@ -176,10 +274,10 @@ class TelegramNotificationService(BaseService):
     def _execute_command(
             self, command: Union[Command, DynamicEnumMember], arguments: list, chat_id: int
     ) -> list[TelegramPayload]:
-        """Executes a command by searching for its action in the handlers."""
-        command_details = self._search_in_handlers(command)
+        """Executes a command on the handlers declaring it."""
         responses = []
-        for handler in self._telegram_handlers:
+        # Handlers not declaring the command would only answer an empty message
+        for handler in self._command_handlers.get(command, ()):
             response = handler.process_command(command=command, arguments=arguments)
             if isinstance(response, list):
                 responses.extend(response)
@@ -194,8 +292,14 @@ class TelegramNotificationService(BaseService):
             command: Union[Command, DynamicEnumMember],
             arguments: list,
             chat_id: int,
+            current_prompt: Optional[CurrentPrompt] = None,
     ) -> list[TelegramPayload]:
-        """Processes an interactive prompt (ask/respond) with multiple questions."""
+        """
+        Processes an interactive prompt (ask/respond) with multiple questions.
+        For 'respond', current_prompt is the active prompt when already read.
+        It is resolved once the answer is processed: if the 'respond' callback
+        fails, the user can answer again.
+        """
         # logger.debug("Traitement du prompt: action=%s, command=%s, arguments=%s", action, command, arguments)
         command_details = self._search_in_handlers(command)
 
@@ -217,7 +321,8 @@ class TelegramNotificationService(BaseService):
             return []
 
         elif action == "respond":
-            current_prompt = self._history_manager.get_last_active_prompt(chat_id)
+            if current_prompt is None:
+                current_prompt = self._history_manager.get_last_active_prompt(chat_id)
             if not current_prompt:
                 logger.warning("No active prompt found for chat_id=%s", chat_id)
                 return []
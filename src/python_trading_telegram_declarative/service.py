@@ -2,7 +2,7 @@ import queue
 import re
 import threading
 from abc import abstractmethod
-from typing import Optional, Union
+from typing import Optional, Sequence, Union
 
 from python_trading_telegram_declarative.classes.command import Command
 from python_trading_telegram_declarative.classes.enums import DynamicEnum, DynamicEnumMember
@@ -10,9 +10,16 @@ from python_trading_telegram_declarative.classes.menu import Menu
 from python_trading_telegram_declarative.classes.payload import TelegramPayload
 from python_trading_telegram_declarative.client import TelegramClient
 from python_trading_telegram_declarative.history import TelegramHistoryManager
-from python_trading_telegram_declarative.message_queue import MessageReceiver, MessageSender
+from python_trading_telegram_declarative.message_queue import (MessageReceiver, MessageSender,
+                                                               RateLimiter, WebhookReceiver)
 from python_trading_telegram_declarative.tools.logger import logger
 
+# Callback data format: "[action:]/command[:arg1;arg2...]", compiled once
+_COMMAND_PATTERN = re.compile(r"^((?:ask|respond|cancel|confirm):)?(\/\w+)(?::(.*))?$")
+
+# Enums tried, in order, to resolve the command of a callback
+_COMMAND_ENUMS = (Command, Menu)
+
 
 class TelegramService:
     """
@@ -27,14 +34,38 @@ class TelegramService:
             chat_id: str,
             endpoints: dict,
             history_manager: TelegramHistoryManager,
+            allowed_updates: Optional[Sequence[str]] = None,
+            rate_limiter: Optional[RateLimiter] = None,
     ):
+        """
+        :param allowed_updates: Update types Telegram should deliver, e.g.
+            ["message", "callback_query"]. By default Telegram keeps its own
+            setting.
+        :param rate_limiter: Paces outgoing messages (default: no pacing).
+        """
         self.__chat_id = chat_id
         self.__history_manager = history_manager
 
         # Components with separated responsibilities
         self.__client = TelegramClient(api_base_url, bot_token, endpoints)
-        self.__sender = MessageSender(self.__client, chat_id, history_manager)
-        self.__receiver = MessageReceiver(self.__client, history_manager)
+        self.__sender = MessageSender(
+            self.__client, chat_id, history_manager, rate_limiter
+        )
+        webhook = endpoints.get("webhook")
+        if webhook:
+            # Updates pushed by Telegram instead of long polling
+            self.__receiver = WebhookReceiver(
+                self.__client,
+                history_manager,
+                webhook["url"],
+                (webhook.get("host", "127.0.0.1"), webhook.get("port", 8080)),
+                webhook.get("secret_token"),
+                allowed_updates=allowed_updates,
+            )
+        else:
+            self.__receiver = MessageReceiver(
+                self.__client, history_manager, allowed_updates
+            )
 
         # Command processor
         self.__processor_thread = None
@@ -44,7 +75,10 @@ class TelegramService:
 
     @property
     def incoming_queue(self) -> queue.Queue:
-        """Access to the incoming messages queue."""
+        """
+        Access to the incoming messages queue of
+        (update, chat_id, message_type, content) tuples.
+        """
         return self.__receiver.incoming_queue
 
     def start(self):
@@ -63,6 +97,7 @@ class TelegramService:
 
         if self.__processor_thread and self.__processor_thread.is_alive():
             self.__processor_thread.join(timeout=5)
+        self.__client.close()
         logger.info("TelegramService stopped")
 
     def send_message(self, messages: Union[TelegramPayload, list[TelegramPayload]]):
@@ -88,7 +123,7 @@ class TelegramService:
         """Starts the command processor."""
         if self.__processor_thread is None or not self.__processor_thread.is_alive():
             self.__processor_thread = threading.Thread(
-                target=self._process_commands, daemon=True
+                target=self._process_commands, name="tg-processor", daemon=True
             )
             self.__processor_thread.start()
 
@@ -109,20 +144,19 @@ class TelegramService:
     ) -> tuple[Optional[str], Optional[DynamicEnumMember], list]:
         """Parses a command from a callback query."""
         data = command_update.get("callback_query", {}).get("data", "")
-        pattern = r"^((?:ask|respond|cancel|confirm):)?(\/\w+)(?::(.*))?$"
-        match = re.match(pattern, data)
+        match = _COMMAND_PATTERN.match(data)
         if not match:
             return None, None, []
 
         action, command_str, params_str = match.groups()
         action = action[:-1] if action else None
-        enum_command = self._cast_to_enum(command_str, [Command, Menu])
+        enum_command = self._cast_to_enum(command_str, _COMMAND_ENUMS)
         arguments = params_str.split(";") if params_str else []
         return action, enum_command, arguments
 
     @staticmethod
     def _cast_to_enum(
-            value: str, enums: list[type[DynamicEnum]]
+            value: str, enums: Sequence[type[DynamicEnum]]
     ) -> Optional[DynamicEnumMember]:
         """Attempts to cast a string to one of the dynamic enums."""
         for enum_class in enums:
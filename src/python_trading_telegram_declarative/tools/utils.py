@@ -1,6 +1,23 @@
 # telegram/utils.py
+import json
 from typing import Any, List
 
+try:
+    import orjson
+except ImportError:  # orjson is an optional dependency
+    orjson = None
+
+try:
+    from itertools import batched
+except ImportError:  # Python < 3.12
+    from itertools import islice
+
+    def batched(iterable, n):
+        """Regroupe les éléments en tuples de n (équivalent de itertools.batched)."""
+        iterator = iter(iterable)
+        while batch := tuple(islice(iterator, n)):
+            yield batch
+
 
 def ensure_list(item: Any) -> List[Any]:
     """Convertit un élément en liste s'il ne l'est pas déjà."""
@@ -12,5 +29,25 @@ def is_empty_or_none(value: Any) -> bool:
     return value is None or (isinstance(value, str) and value == "")
 
 
-def truncate_text(text, max_length=14):
-    return text[: max_length - 3] + "..." if len(text) > max_length else text
+def truncate_text(text: str, max_length: int = 14) -> str:
+    """Tronque le texte à max_length caractères, points de suspension compris."""
+    if len(text) <= max_length:
+        return text
+    return f"{text[: max_length - 3]}..."
+
+
+if orjson is not None:
+
+    def json_dumps(obj: Any) -> str:
+        """Sérialise en JSON compact (orjson)."""
+        return orjson.dumps(obj).decode()
+
+    json_loads = orjson.loads
+
+else:
+
+    def json_dumps(obj: Any) -> str:
+        """Sérialise en JSON compact (stdlib, orjson absent)."""
+        return json.dumps(obj, separators=(",", ":"))
+
+    json_loads = json.loads
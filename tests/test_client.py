@@ -1,3 +1,4 @@
+import json
 import unittest
 from unittest.mock import Mock, patch
 
@@ -17,13 +18,11 @@ class TestTelegramClient(unittest.TestCase):
         self.endpoints = {"text": "/sendMessage", "updates": "/getUpdates"}
         self.client = TelegramClient(self.api_base_url, self.bot_token, self.endpoints)
 
-    @patch("python_trading_telegram_declarative.client.requests.post")
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
     def test_send_message_success(self, mock_post):
         """Test successful message sending."""
         # Arrange
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.raise_for_status = Mock()
+        mock_response = Mock(status_code=200)
         mock_post.return_value = mock_response
 
         payload = {"chat_id": "123", "text": "Test message"}
@@ -38,19 +37,12 @@ class TestTelegramClient(unittest.TestCase):
         self.assertIn("data", call_args.kwargs)
         self.assertEqual(call_args.kwargs["data"], payload)
 
-    @patch("python_trading_telegram_declarative.client.requests.post")
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
     def test_send_message_with_retry_on_500_error(self, mock_post):
         """Test automatic retry on 500 error."""
         # Arrange
-        mock_response_500 = Mock()
-        mock_response_500.status_code = 500
-        mock_response_500.raise_for_status.side_effect = requests.HTTPError(
-            response=mock_response_500
-        )
-
-        mock_response_success = Mock()
-        mock_response_success.status_code = 200
-        mock_response_success.raise_for_status = Mock()
+        mock_response_500 = Mock(status_code=500)
+        mock_response_success = Mock(status_code=200)
 
         # First call fails, second succeeds
         mock_post.side_effect = [mock_response_500, mock_response_success]
@@ -65,17 +57,11 @@ class TestTelegramClient(unittest.TestCase):
         self.assertEqual(result, mock_response_success)
         self.assertEqual(mock_post.call_count, 2)
 
-    @patch("python_trading_telegram_declarative.client.requests.post")
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
     def test_send_message_fail_on_400_error(self, mock_post):
         """Test immediate failure on 400 error (non-recoverable)."""
         # Arrange
-        mock_response = Mock()
-        mock_response.status_code = 400
-        mock_response.text = "Bad Request"
-        mock_response.raise_for_status.side_effect = requests.HTTPError(
-            response=mock_response
-        )
-        mock_post.return_value = mock_response
+        mock_post.return_value = Mock(status_code=400, text="Bad Request")
 
         payload = {"chat_id": "123", "text": "Test message"}
 
@@ -86,13 +72,13 @@ class TestTelegramClient(unittest.TestCase):
         self.assertIn("400", str(context.exception))
         mock_post.assert_called_once()  # No retry on 400
 
-    @patch("python_trading_telegram_declarative.client.requests.post")
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
     def test_send_message_retry_on_network_error(self, mock_post):
         """Test retry on network error."""
         # Arrange
         mock_post.side_effect = [
             requests.ConnectionError("Connection failed"),
-            Mock(status_code=200, raise_for_status=Mock()),
+            Mock(status_code=200),
         ]
 
         payload = {"chat_id": "123", "text": "Test message"}
@@ -105,7 +91,7 @@ class TestTelegramClient(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertEqual(mock_post.call_count, 2)
 
-    @patch("python_trading_telegram_declarative.client.requests.post")
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
     def test_send_message_max_retries_exceeded(self, mock_post):
         """Test failure after exceeding max retry attempts."""
         # Arrange
@@ -120,19 +106,12 @@ class TestTelegramClient(unittest.TestCase):
         self.assertIn("3 attempts", str(context.exception))
         self.assertEqual(mock_post.call_count, 3)
 
-    @patch("python_trading_telegram_declarative.client.requests.post")
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
     def test_send_message_rate_limiting_429(self, mock_post):
         """Test retry on 429 error (rate limiting)."""
         # Arrange
-        mock_response_429 = Mock()
-        mock_response_429.status_code = 429
-        mock_response_429.raise_for_status.side_effect = requests.HTTPError(
-            response=mock_response_429
-        )
-
-        mock_response_success = Mock()
-        mock_response_success.status_code = 200
-        mock_response_success.raise_for_status = Mock()
+        mock_response_429 = Mock(status_code=429, headers={}, content=b"")
+        mock_response_success = Mock(status_code=200)
 
         mock_post.side_effect = [mock_response_429, mock_response_success]
 
@@ -146,7 +125,7 @@ class TestTelegramClient(unittest.TestCase):
         self.assertEqual(result, mock_response_success)
         self.assertEqual(mock_post.call_count, 2)
 
-    @patch("python_trading_telegram_declarative.client.requests.get")
+    @patch("python_trading_telegram_declarative.client.requests.Session.get")
     def test_get_updates_success(self, mock_get):
         """Test successful updates retrieval."""
         # Arrange
@@ -155,7 +134,7 @@ class TestTelegramClient(unittest.TestCase):
             "result": [{"update_id": 1, "message": {"text": "Hello"}}],
         }
         mock_response = Mock()
-        mock_response.json.return_value = expected_updates
+        mock_response.content = json.dumps(expected_updates).encode()
         mock_response.raise_for_status = Mock()
         mock_get.return_value = mock_response
 
@@ -170,7 +149,7 @@ class TestTelegramClient(unittest.TestCase):
         call_args = mock_get.call_args
         self.assertEqual(call_args.kwargs["params"], params)
 
-    @patch("python_trading_telegram_declarative.client.requests.get")
+    @patch("python_trading_telegram_declarative.client.requests.Session.get")
     def test_get_updates_network_error(self, mock_get):
         """Test network error during updates retrieval."""
         # Arrange
@@ -183,14 +162,78 @@ class TestTelegramClient(unittest.TestCase):
 
         self.assertIn("getUpdates", str(context.exception))
 
+    @patch("python_trading_telegram_declarative.client.requests.Session.close")
+    def test_close_releases_session(self, mock_close):
+        """Test that closing the client closes its HTTP session."""
+        # Act
+        self.client.close()
+
+        # Assert
+        mock_close.assert_called_once()
+
     def test_exponential_backoff_timing(self):
         """Test exponential backoff calculation."""
-        # Test that delay increases exponentially
-        expected_delays = [0.5, 1.0, 2.0]  # 2^0 * 0.5, 2^1 * 0.5, 2^2 * 0.5
+        # Jittered delay stays under the exponential bound
+        max_delays = [0.5, 1.0, 2.0]  # 2^0 * 0.5, 2^1 * 0.5, 2^2 * 0.5
+
+        for attempt, max_delay in enumerate(max_delays):
+            for _ in range(20):
+                actual_delay = TelegramClient._backoff_delay(attempt)
+                self.assertGreaterEqual(actual_delay, 0)
+                self.assertLessEqual(actual_delay, max_delay)
+
+        # Retry-After is a floor
+        self.assertGreaterEqual(TelegramClient._backoff_delay(0, retry_after=5), 5)
+
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
+    def test_send_message_429_honors_retry_after(self, mock_post):
+        """Test that a 429 waits at least the Retry-After delay."""
+        # Arrange
+        mock_response_429 = Mock(status_code=429, headers={"Retry-After": "7"})
+        mock_response_success = Mock(status_code=200)
+        mock_post.side_effect = [mock_response_429, mock_response_success]
 
-        for attempt, expected_delay in enumerate(expected_delays):
-            actual_delay = (2 ** attempt) * 0.5
-            self.assertEqual(actual_delay, expected_delay)
+        # Act
+        with patch("time.sleep") as mock_sleep:
+            result = self.client.send_message({"chat_id": "123", "text": "Test message"})
+
+        # Assert
+        self.assertEqual(result, mock_response_success)
+        self.assertEqual(mock_post.call_count, 2)
+        mock_sleep.assert_called_once()
+        self.assertGreaterEqual(mock_sleep.call_args.args[0], 7)
+
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
+    def test_send_message_429_exhausted_carries_retry_after(self, mock_post):
+        """Test that the retry_after of Telegram's JSON body is kept on failure."""
+        # Arrange
+        mock_post.return_value = Mock(
+            status_code=429,
+            headers={},
+            content=b'{"ok":false,"error_code":429,"parameters":{"retry_after":12}}',
+        )
+
+        # Act
+        with patch("time.sleep"), self.assertRaises(TelegramAPIError) as context:
+            self.client.send_message({"chat_id": "123", "text": "Test message"})
+
+        # Assert
+        self.assertEqual(context.exception.retry_after, 12)
+
+    @patch("python_trading_telegram_declarative.client.requests.Session.post")
+    def test_send_message_429_long_retry_after_is_not_slept(self, mock_post):
+        """Test that a retry_after above the backoff cap is left to the caller."""
+        # Arrange
+        mock_post.return_value = Mock(status_code=429, headers={"Retry-After": "600"})
+
+        # Act
+        with patch("time.sleep") as mock_sleep, self.assertRaises(TelegramAPIError) as context:
+            self.client.send_message({"chat_id": "123", "text": "Test message"})
+
+        # Assert
+        self.assertEqual(context.exception.retry_after, 600)
+        self.assertEqual(mock_post.call_count, 1)
+        mock_sleep.assert_not_called()
 
 
 if __name__ == "__main__":
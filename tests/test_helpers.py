@@ -1,6 +1,7 @@
 """Test helper utilities for type compatibility."""
 
-from typing import Any, Dict
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
 
 # Type alias for test payload to avoid type checking issues
 TestPayload = Dict[str, Any]
@@ -19,3 +20,39 @@ def create_test_message(text: str) -> TestPayload:
 def create_test_messages(texts: list[str]) -> list[TestPayload]:
     """Create multiple test messages."""
     return [create_test_message(text) for text in texts]
+
+
+class FakeClient:
+    """Lightweight TelegramClient stand-in recording calls in plain lists."""
+
+    __slots__ = ("sent_payloads", "updates")
+
+    def __init__(self, updates: Optional[dict] = None):
+        self.sent_payloads: list = []
+        self.updates = updates if updates is not None else {"result": []}
+
+    def send_message(self, payload: dict, max_retries: int = 3) -> SimpleNamespace:
+        self.sent_payloads.append(payload)
+        return SimpleNamespace(status_code=200)
+
+    def get_updates(self, params: dict, timeout: tuple = (3, 30)) -> dict:
+        return self.updates
+
+
+class FakeHistoryManager:
+    """Lightweight TelegramHistoryManager stand-in recording interactions."""
+
+    __slots__ = ("interactions",)
+
+    def __init__(self):
+        self.interactions: list = []
+
+    def log_interaction(
+            self,
+            direction: str,
+            chat_id: int,
+            message_type: str,
+            content: dict,
+            update_id: Optional[int] = None,
+    ):
+        self.interactions.append((direction, chat_id, message_type, content, update_id))
@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from datetime import datetime
+from unittest.mock import patch
+
+from python_trading_telegram_declarative.classes.command import Command
+from python_trading_telegram_declarative.classes.types import CurrentPrompt
+from python_trading_telegram_declarative.history import TelegramHistoryManager
+
+# Schema and rows as written by the first version of TelegramHistoryManager
+_BASELINE_SCHEMA_SQL = """
+    CREATE TABLE interactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME NOT NULL,
+        direction TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        update_id INTEGER,
+        message_type TEXT NOT NULL,
+        content TEXT NOT NULL,
+        is_prompt BOOLEAN DEFAULT FALSE,
+        prompt_status TEXT DEFAULT NULL
+    )
+"""
+
+_BASELINE_INSERT_SQL = """
+    INSERT INTO interactions (
+        timestamp, direction, chat_id, update_id, message_type, content, is_prompt, prompt_status
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _prompt(arguments: list, current_prompt_index: int = 0) -> CurrentPrompt:
+    return CurrentPrompt(
+        action="ask",
+        command=Command.from_value("/quiz"),
+        arguments=arguments,
+        current_prompt_index=current_prompt_index,
+    )
+
+
+class TestTelegramHistoryManager(unittest.TestCase):
+    """Unit tests for TelegramHistoryManager."""
+
+    def setUp(self):
+        """Initial setup for each test."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "history.db")
+
+    def _open(self, **kwargs) -> TelegramHistoryManager:
+        history_manager = TelegramHistoryManager(self.db_path, **kwargs)
+        self.addCleanup(history_manager.close)
+        return history_manager
+
+    def _query(self, sql: str, *params) -> list:
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def test_interactions_are_readable_after_flush(self):
+        """Test interactions logged in the background are written by flush()."""
+        # Arrange
+        history_manager = self._open()
+
+        # Act
+        history_manager.log_interaction("incoming", 42, "text", {"text": "Hi"}, 7)
+        history_manager.log_interaction("outgoing", 42, "message", {"text": "Hello"})
+        history_manager.flush()
+
+        # Assert
+        rows = self._query(
+            "SELECT direction, chat_id, update_id, content FROM interactions ORDER BY id"
+        )
+        self.assertEqual(
+            rows,
+            [
+                ("incoming", 42, 7, '{"text":"Hi"}'),
+                ("outgoing", 42, None, '{"text":"Hello"}'),
+            ],
+        )
+        (timestamp,) = self._query("SELECT typeof(timestamp) FROM interactions LIMIT 1")[0]
+        self.assertEqual(timestamp, "integer")
+
+    def test_pop_active_prompt(self):
+        """Test the latest active prompt is returned and all are resolved."""
+        # Arrange
+        history_manager = self._open()
+        history_manager.log_prompt(_prompt(["first"]), 42)
+        history_manager.log_prompt(_prompt(["a", ["list", "answer"]], 1), 42)
+        history_manager.log_prompt(_prompt(["other chat"]), 43)
+
+        # Act
+        prompt = history_manager.pop_active_prompt(42)
+
+        # Assert
+        self.assertEqual(prompt.action, "ask")
+        self.assertEqual(prompt.command, "/quiz")
+        self.assertEqual(prompt.arguments, ["a", ["list", "answer"]])
+        self.assertEqual(prompt.current_prompt_index, 1)
+        self.assertIsNone(history_manager.pop_active_prompt(42))
+        self.assertEqual(history_manager.get_last_active_prompt(43).arguments, ["other chat"])
+
+    def test_pop_active_prompt_without_returning(self):
+        """Test the SELECT + UPDATE fallback used before SQLite 3.35."""
+        # Arrange
+        history_manager = self._open()
+        history_manager.log_prompt(_prompt(["first"]), 42)
+        history_manager.log_prompt(_prompt(["second"]), 42)
+
+        # Act
+        with patch("python_trading_telegram_declarative.history._HAS_RETURNING", False):
+            prompt = history_manager.pop_active_prompt(42)
+            next_prompt = history_manager.pop_active_prompt(42)
+
+        # Assert
+        self.assertEqual(prompt.arguments, ["second"])
+        self.assertIsNone(next_prompt)
+
+    def test_migrates_baseline_database(self):
+        """Test a database created by the first schema is upgraded in place."""
+        # Arrange
+        logged_at = datetime(2024, 5, 17, 14, 30, 15, 123456)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(_BASELINE_SCHEMA_SQL)
+            conn.execute(
+                _BASELINE_INSERT_SQL,
+                (str(logged_at), "incoming", 42, 7, "text", '{"text": "Hi"}', False, None),
+            )
+            conn.execute(
+                _BASELINE_INSERT_SQL,
+                (
+                    str(logged_at),
+                    "system",
+                    42,
+                    None,
+                    "prompt_start",
+                    '{"action": "ask", "command": "/quiz", "arguments": ["x"], '
+                    '"current_prompt_index": 2}',
+                    True,
+                    "active",
+                ),
+            )
+
+        # Act
+        history_manager = self._open()
+
+        # Assert
+        self.assertEqual(self._query("PRAGMA user_version"), [(2,)])
+        expected_ns = int(logged_at.timestamp() * 1000) * 1_000_000
+        self.assertEqual(
+            self._query("SELECT timestamp FROM interactions"),
+            [(expected_ns,), (expected_ns,)],
+        )
+        prompt = history_manager.pop_active_prompt(42)
+        self.assertEqual(
+            (prompt.action, prompt.command, prompt.arguments, prompt.current_prompt_index),
+            ("ask", "/quiz", ["x"], 2),
+        )
+        self.assertTrue(
+            self._query("SELECT 1 FROM sqlite_master WHERE name = 'idx_active_prompt'")
+        )
+
+    def test_prunes_old_rows_but_keeps_active_prompts(self):
+        """Test max_rows_per_chat keeps the newest rows and active prompts."""
+        # Arrange: every written batch is pruned
+        prune_interval = patch("python_trading_telegram_declarative.history._PRUNE_INTERVAL", 0)
+        prune_interval.start()
+        self.addCleanup(prune_interval.stop)
+        history_manager = self._open(max_rows_per_chat=3)
+        history_manager.log_prompt(_prompt(["kept"]), 42)
+
+        # Act
+        for index in range(10):
+            history_manager.log_interaction("incoming", 42, "text", {"text": str(index)})
+        history_manager.log_interaction("incoming", 43, "text", {"text": "other"})
+        history_manager.flush()
+
+        # Assert
+        contents = [
+            row[0]
+            for row in self._query(
+                "SELECT content FROM interactions WHERE chat_id = 42 AND is_prompt = 0 ORDER BY id"
+            )
+        ]
+        self.assertEqual(contents, ['{"text":"7"}', '{"text":"8"}', '{"text":"9"}'])
+        self.assertEqual(history_manager.get_last_active_prompt(42).arguments, ["kept"])
+        self.assertEqual(self._query("SELECT COUNT(*) FROM interactions WHERE chat_id = 43"), [(1,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
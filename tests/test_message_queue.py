@@ -1,11 +1,16 @@
+import json
 import queue
 import unittest
+import urllib.error
+import urllib.request
 from unittest.mock import Mock, patch
 
-from tests.test_helpers import (create_test_message, create_test_messages,
-                                create_test_payload)
+from tests.test_helpers import (FakeClient, FakeHistoryManager, create_test_message,
+                                create_test_messages, create_test_payload)
 from python_trading_telegram_declarative.client import TelegramAPIError, TelegramNetworkError
-from python_trading_telegram_declarative.message_queue import MessageReceiver, MessageSender
+from python_trading_telegram_declarative.message_queue import (_STOP, MessageReceiver,
+                                                               MessageSender, RateLimiter,
+                                                               WebhookReceiver)
 
 
 # noinspection PyUnresolvedReferences,PyTypeChecker
@@ -23,9 +28,9 @@ class TestMessageSender(unittest.TestCase):
 
     def test_init(self):
         """Test initialization."""
-        self.assertEqual(self.sender._MessageSender__chat_id, self.chat_id)
-        self.assertIsNotNone(self.sender._MessageSender__outgoing_queue)
-        self.assertIsNone(self.sender._MessageSender__sender_thread)
+        self.assertEqual(self.sender._get_test_attributes()["chat_id"], self.chat_id)
+        self.assertIsNotNone(self.sender._get_test_attributes()["outgoing_queue"])
+        self.assertIsNone(self.sender._get_test_attributes()["sender_thread"])
 
     def test_send_valid_message(self):
         """Test adding a valid message to the queue."""
@@ -36,8 +41,8 @@ class TestMessageSender(unittest.TestCase):
         self.sender.send_message(message)
 
         # Assert
-        self.assertFalse(self.sender._MessageSender__outgoing_queue.empty())
-        queued_message = self.sender._MessageSender__outgoing_queue.get()
+        self.assertFalse(self.sender._get_test_attributes()["outgoing_queue"].empty())
+        queued_message = self.sender._get_test_attributes()["outgoing_queue"].get()
         self.assertEqual(queued_message, message)
 
     def test_send_invalid_message(self):
@@ -63,7 +68,7 @@ class TestMessageSender(unittest.TestCase):
         self.sender.send_message(messages)
 
         # Assert
-        self.assertEqual(self.sender._MessageSender__outgoing_queue.qsize(), 2)
+        self.assertEqual(self.sender._get_test_attributes()["outgoing_queue"].qsize(), 2)
 
     def test_build_payload(self):
         """Test payload construction."""
@@ -78,6 +83,12 @@ class TestMessageSender(unittest.TestCase):
         self.assertEqual(payload["text"], "Test")
         self.assertEqual(payload["reply_markup"], '{"inline_keyboard":[]}')
 
+    def test_build_payload_ignores_undeclared_keys(self):
+        """Test keys outside TelegramPayload, such as chat_id, are not forwarded."""
+        payload = self.sender._build_payload({"text": "Test", "chat_id": "999", "extra": 1})
+
+        self.assertEqual(payload, {"chat_id": self.chat_id, "text": "Test", "reply_markup": ""})
+
     def test_is_valid_message_static_method(self):
         """Test static message validation method."""
         # Test valid message
@@ -96,7 +107,7 @@ class TestMessageSender(unittest.TestCase):
         # Arrange
         messages = create_test_messages(["Message 1", "Message 2"])
         for msg in messages:
-            self.sender._MessageSender__outgoing_queue.put(msg)
+            self.sender._get_test_attributes()["outgoing_queue"].put(msg)
 
         # Act
         self.sender.flush_queue()
@@ -107,6 +118,45 @@ class TestMessageSender(unittest.TestCase):
         self.assertEqual(self.mock_client.send_message.call_count, 2)
         self.assertEqual(self.mock_history_manager.log_interaction.call_count, 2)
 
+    def test_flush_queue_coalesces_text_messages(self):
+        """Test plain-text messages are merged, keyboards are sent alone."""
+        # Arrange
+        sender = MessageSender(
+            self.mock_client, self.chat_id, self.mock_history_manager,
+            coalesce_text=True,
+        )
+        sender.send_message(create_test_messages(["Message 1", "Message 2"]))
+        sender.send_message(create_test_payload("Menu", '{"inline_keyboard":[]}'))
+        sender.send_message(create_test_message("Message 3"))
+
+        # Act
+        sender.flush_queue()
+
+        # Assert
+        sent = [c.args[0] for c in self.mock_client.send_message.call_args_list]
+        self.assertEqual(
+            [p["text"] for p in sent], ["Message 1\nMessage 2", "Menu", "Message 3"]
+        )
+        self.assertEqual(sent[1]["reply_markup"], '{"inline_keyboard":[]}')
+
+    def test_flush_queue_coalesce_respects_length_limit(self):
+        """Test a burst is split into messages of at most 4096 characters."""
+        # Arrange
+        sender = MessageSender(
+            self.mock_client, self.chat_id, self.mock_history_manager,
+            coalesce_text=True,
+        )
+        sender.send_message(create_test_messages(["x" * 99] * 100))
+
+        # Act
+        sender.flush_queue()
+
+        # Assert: 100 lines of 100 characters (newline included) fit in 3 messages
+        sent = [c.args[0]["text"] for c in self.mock_client.send_message.call_args_list]
+        self.assertEqual(len(sent), 3)
+        self.assertTrue(all(len(text) <= 4096 for text in sent))
+        self.assertEqual("\n".join(sent), "\n".join(["x" * 99] * 100))
+
     @patch("threading.Thread")
     def test_start_thread(self, mock_thread_class):
         """Test sending thread startup."""
@@ -134,10 +184,72 @@ class TestMessageSender(unittest.TestCase):
             self.sender.stop()
 
         # Assert
-        self.assertTrue(self.sender._MessageSender__stop_event.is_set())
+        self.assertTrue(self.sender._get_test_attributes()["stop_event"].is_set())
         mock_flush.assert_called_once()
         mock_thread.join.assert_called_once_with(timeout=5)
 
+    def test_message_sender_stops_on_signal(self):
+        """Test the sending thread drains messages until the stop signal."""
+        # Arrange
+        self.sender.send_message(create_test_message("Hello"))
+        self.sender._get_test_attributes()["outgoing_queue"].put(_STOP)
+
+        # Act
+        self.sender._message_sender()
+
+        # Assert
+        self.mock_client.send_message.assert_called_once()
+        self.assertTrue(self.sender._get_test_attributes()["outgoing_queue"].empty())
+
+    def test_next_batch_drains_pending_messages(self):
+        """Test that pending messages are drained up to the stop signal."""
+        # Arrange
+        self.sender.send_message(create_test_messages(["Message 1", "Message 2"]))
+        self.sender._get_test_attributes()["outgoing_queue"].put(_STOP)
+        self.sender.send_message(create_test_message("Message 3"))
+
+        # Act
+        batch = self.sender._next_batch()
+
+        # Assert
+        self.assertEqual([m["text"] for m in batch[:-1]], ["Message 1", "Message 2"])
+        self.assertIs(batch[-1], _STOP)
+        self.assertEqual(self.sender._get_test_attributes()["outgoing_queue"].qsize(), 1)
+
+    def test_message_sender_waits_for_rate_limiter(self):
+        """Test the sending thread waits the delay given by the rate limiter."""
+        # Arrange
+        rate_limiter = Mock()
+        rate_limiter.acquire.side_effect = [0.0, 0.5, 0.0]
+        self.sender = MessageSender(
+            self.mock_client, self.chat_id, self.mock_history_manager, rate_limiter
+        )
+        self.sender._MessageSender__stop_event = Mock()
+        self.sender._MessageSender__stop_event.wait.return_value = False
+        self.sender.send_message(create_test_messages(["Message 1", "Message 2"]))
+        self.sender._get_test_attributes()["outgoing_queue"].put(_STOP)
+
+        # Act
+        self.sender._message_sender()
+
+        # Assert
+        self.sender._get_test_attributes()["stop_event"].wait.assert_called_once_with(0.5)
+        self.assertEqual(self.mock_client.send_message.call_count, 2)
+
+    def test_message_sender_does_not_pace_by_default(self):
+        """Test messages are sent back to back without a rate limiter."""
+        # Arrange
+        self.sender._MessageSender__stop_event = Mock()
+        self.sender.send_message(create_test_messages(["Message 1", "Message 2", "Message 3"]))
+        self.sender._get_test_attributes()["outgoing_queue"].put(_STOP)
+
+        # Act
+        self.sender._message_sender()
+
+        # Assert
+        self.sender._get_test_attributes()["stop_event"].wait.assert_not_called()
+        self.assertEqual(self.mock_client.send_message.call_count, 3)
+
     def test_send_payload_with_error_handling(self):
         """Test error handling during sending."""
         # Arrange
@@ -149,6 +261,53 @@ class TestMessageSender(unittest.TestCase):
             self.sender._send_payload(payload)
         self.mock_history_manager.log_interaction.assert_called_once()
 
+    def test_send_payload_honors_retry_after(self):
+        """Test that a rate-limited payload is resent after retry_after."""
+        # Arrange
+        self.mock_client.send_message.side_effect = [
+            TelegramAPIError("HTTP 429", retry_after=2),
+            None,
+        ]
+        stop_event = Mock()
+        stop_event.wait.return_value = False
+        self.sender._MessageSender__stop_event = stop_event
+        payload = {"chat_id": self.chat_id, "text": "Test"}
+
+        # Act
+        self.sender._send_payload(payload)
+
+        # Assert
+        stop_event.wait.assert_called_once_with(2)
+        self.assertEqual(self.mock_client.send_message.call_count, 2)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Unit tests for RateLimiter."""
+
+    def setUp(self):
+        """Initial setup for each test."""
+        self.now = 0.0
+        self.clock = lambda: self.now
+
+    def test_per_chat_rate(self):
+        """Test one message per second per chat, chats being independent."""
+        rate_limiter = RateLimiter(per_chat_rate=1.0, clock=self.clock)
+
+        self.assertEqual(rate_limiter.acquire(1), 0)
+        self.assertAlmostEqual(rate_limiter.acquire(1), 1.0)
+        self.assertEqual(rate_limiter.acquire(2), 0)
+
+        self.now += 1.0
+        self.assertEqual(rate_limiter.acquire(1), 0)
+
+    def test_global_rate(self):
+        """Test the global bucket limits messages across chats."""
+        rate_limiter = RateLimiter(per_chat_rate=10.0, global_rate=2.0, clock=self.clock)
+
+        self.assertEqual(rate_limiter.acquire(1), 0)
+        self.assertEqual(rate_limiter.acquire(2), 0)
+        self.assertAlmostEqual(rate_limiter.acquire(3), 0.5)
+
 
 # noinspection PyUnresolvedReferences,PyTypeChecker
 class TestMessageReceiver(unittest.TestCase):
@@ -163,8 +322,8 @@ class TestMessageReceiver(unittest.TestCase):
     def test_init(self):
         """Test initialization."""
         self.assertIsNotNone(self.receiver.incoming_queue)
-        self.assertIsNone(self.receiver._MessageReceiver__last_update_id)
-        self.assertIsNone(self.receiver._MessageReceiver__receiver_thread)
+        self.assertIsNone(self.receiver._get_test_attributes()["last_update_id"])
+        self.assertIsNone(self.receiver._get_test_attributes()["receiver_thread"])
 
     def test_parse_update_text_message(self):
         """Test parsing a text message."""
@@ -207,6 +366,19 @@ class TestMessageReceiver(unittest.TestCase):
         self.assertEqual(msg_type, "unknown")
         self.assertEqual(content, update)
 
+    def test_parse_update_malformed(self):
+        """Test parsing an update missing its chat."""
+        # Arrange
+        update = {"callback_query": {"data": "/command"}}
+
+        # Act
+        chat_id, msg_type, content = MessageReceiver.parse_update(update)
+
+        # Assert
+        self.assertIsNone(chat_id)
+        self.assertEqual(msg_type, "unknown")
+        self.assertEqual(content, update)
+
     @patch("threading.Thread")
     def test_start_thread(self, mock_thread_class):
         """Test reception thread startup."""
@@ -233,7 +405,7 @@ class TestMessageReceiver(unittest.TestCase):
         self.receiver.stop()
 
         # Assert
-        self.assertTrue(self.receiver._MessageReceiver__stop_event.is_set())
+        self.assertTrue(self.receiver._get_test_attributes()["stop_event"].is_set())
         # Verify that a stop signal has been added to the queue
         signal = self.receiver.incoming_queue.get()
         self.assertIsNone(signal)
@@ -246,10 +418,9 @@ class TestMessageReceiver(unittest.TestCase):
 
         # Assert
         self.assertIsInstance(queue_ref, queue.Queue)
-        self.assertIs(queue_ref, self.receiver._MessageReceiver__incoming_queue)
+        self.assertIs(queue_ref, self.receiver._get_test_attributes()["incoming_queue"])
 
-    @patch("time.sleep")
-    def test_message_receiver_network_error_handling(self, mock_sleep):
+    def test_message_receiver_network_error_handling(self):
         """Test network error handling in reception thread."""
         # Arrange
         self.mock_client.get_updates.side_effect = TelegramNetworkError("Network error")
@@ -265,7 +436,75 @@ class TestMessageReceiver(unittest.TestCase):
 
         # Assert
         mock_logger.warning.assert_called()
-        mock_sleep.assert_called_with(3)  # 3 second wait in case of network error
+        # 3 second wait in case of network error, interrupted by stop()
+        self.receiver._get_test_attributes()["stop_event"].wait.assert_called_with(3)
+
+    def test_message_receiver_skips_redelivered_updates(self):
+        """Test updates already received are not queued again."""
+        # Arrange
+        self.mock_client.get_updates.return_value = {
+            "result": [
+                {"update_id": update_id, "message": {"text": "Test", "chat": {"id": 789}}}
+                for update_id in (1, 2, 2, 1, 3)
+            ]
+        }
+        self.receiver._MessageReceiver__stop_event = Mock()
+        self.receiver._MessageReceiver__stop_event.is_set.side_effect = [False, True]
+
+        # Act
+        self.receiver._message_receiver()
+
+        # Assert
+        update_ids = [
+            self.receiver.incoming_queue.get_nowait()[0]["update_id"] for _ in range(3)
+        ]
+        self.assertEqual(update_ids, [1, 2, 3])
+        self.assertTrue(self.receiver.incoming_queue.empty())
+        self.assertEqual(self.receiver._get_test_attributes()["last_update_id"], 3)
+
+    def test_message_receiver_accepts_update_ids_going_backwards(self):
+        """Test updates are still queued when Telegram restarts its ids lower."""
+        # Arrange
+        self.mock_client.get_updates.side_effect = [
+            {"result": [{"update_id": update_id} for update_id in (500, 501)]},
+            {"result": [{"update_id": update_id} for update_id in (501, 7, 8)]},
+        ]
+        self.receiver._MessageReceiver__stop_event = Mock()
+        self.receiver._MessageReceiver__stop_event.is_set.side_effect = [False, False, True]
+
+        # Act
+        self.receiver._message_receiver()
+
+        # Assert
+        update_ids = []
+        while not self.receiver.incoming_queue.empty():
+            update_ids.append(self.receiver.incoming_queue.get_nowait()[0]["update_id"])
+        self.assertEqual(update_ids, [500, 501, 7, 8])
+        self.assertEqual(self.receiver._get_test_attributes()["last_update_id"], 8)
+
+    def test_allowed_updates_are_sent_only_when_given(self):
+        """Test getUpdates omits allowed_updates unless configured."""
+        # Arrange
+        receiver = MessageReceiver(
+            self.mock_client, self.mock_history_manager, ["message", "edited_message"]
+        )
+        for poller in (self.receiver, receiver):
+            poller._MessageReceiver__stop_event = Mock()
+            poller._MessageReceiver__stop_event.is_set.side_effect = [False, True]
+        self.mock_client.get_updates.return_value = {"result": []}
+
+        # Act
+        self.receiver._message_receiver()
+        receiver._message_receiver()
+
+        # Assert
+        default_params, configured_params = (
+            call.args[0] for call in self.mock_client.get_updates.call_args_list
+        )
+        self.assertNotIn("allowed_updates", default_params)
+        self.assertEqual(
+            configured_params["allowed_updates"], '["message","edited_message"]'
+        )
 
     def test_process_updates_from_api(self):
         """Test processing updates received from the API."""
@@ -283,11 +522,136 @@ class TestMessageReceiver(unittest.TestCase):
         self.receiver._message_receiver()
 
         # Assert
-        self.assertEqual(self.receiver._MessageReceiver__last_update_id, 1)
-        self.assertFalse(self.receiver.incoming_queue.empty())
+        self.assertEqual(self.receiver._get_test_attributes()["last_update_id"], 1)
+        update, chat_id, msg_type, content = self.receiver.incoming_queue.get_nowait()
+        self.assertEqual(update["update_id"], 1)
+        self.assertEqual((chat_id, msg_type, content), (789, "text", {"text": "Test"}))
         self.mock_history_manager.log_interaction.assert_called_once()
 
 
+# noinspection PyUnresolvedReferences,PyTypeChecker
+class TestWebhookReceiver(unittest.TestCase):
+    """Unit tests for WebhookReceiver."""
+
+    def setUp(self):
+        """Starts a receiver on a free local port."""
+        self.mock_client = Mock()
+        self.mock_history_manager = Mock()
+        self.receiver = WebhookReceiver(
+            self.mock_client,
+            self.mock_history_manager,
+            "https://example.org/hook",
+            ("127.0.0.1", 0),
+            secret_token="s3cret",
+            poll_interval=0.01,
+        )
+        self.receiver.start()
+        host, port = self.receiver._get_test_attributes()["server"].server_address[:2]
+        self.hook_url = f"http://{host}:{port}/hook"
+
+    def tearDown(self):
+        self.receiver.stop()
+
+    def _post(self, update: dict, secret_token: str = "s3cret", path: str = "/hook") -> int:
+        request = urllib.request.Request(
+            self.hook_url.replace("/hook", path),
+            data=json.dumps(update).encode(),
+            headers={"X-Telegram-Bot-Api-Secret-Token": secret_token},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_start_registers_webhook(self):
+        """Test the webhook is registered with its secret token."""
+        self.receiver._get_test_attributes()["register_thread"].join(timeout=5)
+        self.mock_client.set_webhook.assert_called_once_with(
+            "https://example.org/hook", "s3cret", None
+        )
+
+    def test_pushed_update_is_queued_once(self):
+        """Test a pushed update is parsed and queued, redeliveries skipped."""
+        # Arrange
+        update = {"update_id": 7, "message": {"text": "Hi", "chat": {"id": 42}}}
+
+        # Act
+        status = self._post(update)
+        redelivery_status = self._post(update)
+
+        # Assert
+        self.assertEqual((status, redelivery_status), (200, 200))
+        self.assertEqual(
+            self.receiver.incoming_queue.get(timeout=1),
+            (update, 42, "text", {"text": "Hi"}),
+        )
+        self.assertTrue(self.receiver.incoming_queue.empty())
+        self.mock_history_manager.log_interaction.assert_called_once()
+
+    def test_update_ids_going_backwards_are_queued(self):
+        """Test updates are still queued when Telegram restarts its ids lower."""
+        for update_id in (500, 7):
+            self.assertEqual(self._post({"update_id": update_id}), 200)
+
+        self.assertEqual(self.receiver.incoming_queue.get(timeout=1)[0]["update_id"], 500)
+        self.assertEqual(self.receiver.incoming_queue.get(timeout=1)[0]["update_id"], 7)
+
+    def test_failed_update_is_accepted_again(self):
+        """Test an update whose handling failed is processed on redelivery."""
+        # Arrange
+        update = {"update_id": 7, "message": {"text": "Hi", "chat": {"id": 42}}}
+        self.mock_history_manager.log_interaction.side_effect = [TypeError("boom"), None]
+
+        # Act
+        status = self._post(update)
+        redelivery_status = self._post(update)
+
+        # Assert
+        self.assertEqual((status, redelivery_status), (400, 200))
+        self.assertEqual(self.receiver.incoming_queue.get(timeout=1)[0], update)
+
+    def test_wrong_secret_token_is_rejected(self):
+        """Test requests without the secret token are refused."""
+        status = self._post({"update_id": 1}, secret_token="wrong")
+
+        self.assertEqual(status, 403)
+        self.assertTrue(self.receiver.incoming_queue.empty())
+
+    def test_other_path_is_rejected(self):
+        """Test only the path of the webhook URL is served."""
+        status = self._post({"update_id": 1}, path="/other")
+
+        self.assertEqual(status, 404)
+        self.assertTrue(self.receiver.incoming_queue.empty())
+
+    def test_oversized_body_is_rejected(self):
+        """Test bodies over the size cap are refused without being read."""
+        request = urllib.request.Request(
+            self.hook_url,
+            data=b"{}",
+            headers={
+                "X-Telegram-Bot-Api-Secret-Token": "s3cret",
+                "Content-Length": str(1 << 30),
+            },
+        )
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(request, timeout=5)
+        status = context.exception.code
+
+        self.assertEqual(status, 413)
+        self.assertTrue(self.receiver.incoming_queue.empty())
+
+    def test_secret_token_is_generated_when_missing(self):
+        """Test a receiver without a configured secret still requires one."""
+        receiver = WebhookReceiver(
+            self.mock_client, self.mock_history_manager, "https://example.org/hook"
+        )
+
+        self.assertFalse(receiver._is_authorized(None))
+        self.assertFalse(receiver._is_authorized(""))
+
+
 # noinspection PyUnresolvedReferences,PyTypeChecker
 class TestIntegration(unittest.TestCase):
     """Integration tests between MessageSender and MessageReceiver."""
@@ -295,19 +659,18 @@ class TestIntegration(unittest.TestCase):
     def test_sender_receiver_integration(self):
         """Test integration between sender and receiver."""
         # Arrange
-        mock_client = Mock()
-        mock_history_manager = Mock()
+        client = FakeClient(
+            {
+                "result": [
+                    {"update_id": 1, "message": {"text": "/start", "chat": {"id": 123}}}
+                ]
+            }
+        )
+        history_manager = FakeHistoryManager()
         chat_id = "123"
 
-        sender = MessageSender(mock_client, chat_id, mock_history_manager)
-        receiver = MessageReceiver(mock_client, mock_history_manager)
-
-        # Simulate an API response
-        mock_client.get_updates.return_value = {
-            "result": [
-                {"update_id": 1, "message": {"text": "/start", "chat": {"id": 123}}}
-            ]
-        }
+        sender = MessageSender(client, chat_id, history_manager)
+        receiver = MessageReceiver(client, history_manager)
 
         # Act - Process an incoming message
         receiver._MessageReceiver__stop_event = Mock()
@@ -315,7 +678,7 @@ class TestIntegration(unittest.TestCase):
         receiver._message_receiver()
 
         # Get message from queue
-        received_update = receiver.incoming_queue.get()
+        received_update, _, _, _ = receiver.incoming_queue.get()
 
         # Send a response
         response_message = create_test_payload("Welcome!", "")
@@ -324,10 +687,8 @@ class TestIntegration(unittest.TestCase):
 
         # Assert
         self.assertEqual(received_update["update_id"], 1)
-        mock_client.send_message.assert_called_once()
-        self.assertEqual(
-            mock_history_manager.log_interaction.call_count, 2
-        )  # 1 incoming, 1 outgoing
+        self.assertEqual(len(client.sent_payloads), 1)
+        self.assertEqual(len(history_manager.interactions), 2)  # 1 incoming, 1 outgoing
 
 
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from python_trading_telegram_declarative.classes.command import Command
+from python_trading_telegram_declarative.classes.menu import Menu
+from python_trading_telegram_declarative.handler import TelegramHandler
+from python_trading_telegram_declarative.history import TelegramHistoryManager
+from python_trading_telegram_declarative.notification import TelegramNotificationService
+
+
+class QuizHandler(TelegramHandler):
+    """Handler asking for a number before running its action."""
+
+    def __init__(self):
+        self.answers = []
+        # Commands added after registration
+        self.extra_actions = {}
+
+    @property
+    def command_actions(self) -> dict:
+        return {
+            Menu.from_value("/quiz_menu"): {
+                Command.from_value("/quiz"): {
+                    "action": self.record,
+                    "args": (),
+                    "kwargs": {"value": float},
+                    "asks": [{"text": "Enter a number:", "reply_markup": ""}],
+                    "respond": lambda args: [float(args[0])],
+                },
+                **self.extra_actions,
+            },
+        }
+
+    def record(self, value: float) -> dict:
+        self.answers.append(value)
+        return {"text": f"Recorded {value}", "reply_markup": ""}
+
+
+class TickHandler(TelegramHandler):
+    """Handler sharing the quiz menu and declaring /quiz again."""
+
+    def __init__(self):
+        # (thread name, label) of every /tick run
+        self.ticks = []
+
+    @property
+    def command_actions(self) -> dict:
+        return {
+            Menu.from_value("/quiz_menu"): {
+                Command.from_value("/tick"): {
+                    "action": self.tick,
+                    "args": (),
+                    "kwargs": {"label": str},
+                },
+            },
+            Menu.from_value("/tick_menu"): {
+                Command.from_value("/quiz"): {
+                    "action": self.tick,
+                    "args": (),
+                    "kwargs": {"label": str},
+                    "asks": [{"text": "Shadowed question", "reply_markup": ""}],
+                },
+            },
+        }
+
+    def tick(self, label: str) -> dict:
+        self.ticks.append((threading.current_thread().name, label))
+        return {"text": f"Tick {label}", "reply_markup": ""}
+
+
+# noinspection PyUnresolvedReferences,PyTypeChecker
+class TestTelegramNotificationService(unittest.TestCase):
+    """Unit tests for TelegramNotificationService."""
+
+    def setUp(self):
+        """Initial setup for each test."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.history_manager = TelegramHistoryManager(os.path.join(directory.name, "history.db"))
+        self.addCleanup(self.history_manager.close)
+
+    def _create_service(self, max_workers: int = 1) -> TelegramNotificationService:
+        """Builds a started service whose network components are mocked."""
+        with patch("python_trading_telegram_declarative.service.TelegramClient"), patch(
+                "python_trading_telegram_declarative.service.MessageSender"
+        ), patch("python_trading_telegram_declarative.service.MessageReceiver") as mock_receiver:
+            mock_receiver.return_value.incoming_queue = queue.Queue()
+            service = TelegramNotificationService(
+                "https://api.telegram.org/bot",
+                "123456:ABC-DEF",
+                "123456",
+                {"text": "/sendMessage", "updates": "/getUpdates"},
+                self.history_manager,
+                max_workers=max_workers,
+            )
+        self.addCleanup(self._stop_service, service)
+        return service
+
+    @staticmethod
+    def _stop_service(service: TelegramNotificationService):
+        service.incoming_queue.put(None)  # Stop signal, sent by the real receivers
+        service.stop()
+
+    @staticmethod
+    def _callback_data(payloads: list) -> list[str]:
+        """Callback data of the buttons of a single keyboard payload."""
+        (payload,) = payloads
+        rows = json.loads(payload["reply_markup"])["inline_keyboard"]
+        return [button["callback_data"] for row in rows for button in row]
+
+    def test_help_lists_shared_menus_once(self):
+        """Test /help shows each menu once, even when declared by several handlers."""
+        # Arrange
+        service = self._create_service()
+        service.handler = QuizHandler()
+        service.handler = TickHandler()
+
+        # Act
+        payloads = service._handle_text_message("/help", 5)
+
+        # Assert
+        self.assertEqual(self._callback_data(payloads), ["/quiz_menu", "/tick_menu"])
+        # Built once per handler change, not per request
+        self.assertIs(service._handle_text_message("/help", 5), payloads)
+
+    def test_menu_shows_commands_of_all_handlers(self):
+        """Test a sub-menu merges the commands its handlers declare."""
+        # Arrange
+        service = self._create_service()
+        service.handler = QuizHandler()
+        service.handler = TickHandler()
+
+        # Act
+        payloads = service._handle_callback_query({"callback_query": {"data": "/quiz_menu"}}, 5)
+
+        # Assert
+        self.assertEqual(self._callback_data(payloads), ["/quiz", "/tick"])
+        self.assertIs(
+            service._handle_callback_query({"callback_query": {"data": "/quiz_menu"}}, 5),
+            payloads,
+        )
+
+    def test_first_handler_declaring_a_command_wins(self):
+        """Test prompts come from the first handler and commands reach only their handlers."""
+        # Arrange
+        service = self._create_service()
+        service.handler = QuizHandler()
+        tick_handler = TickHandler()
+        service.handler = tick_handler
+        sender = service._TelegramService__sender
+
+        # Act
+        service._handle_callback_query({"callback_query": {"data": "ask:/quiz"}}, 5)
+        responses = service._execute_command(Command.from_value("/tick"), ["a"], 5)
+
+        # Assert
+        sender.send_message.assert_called_once_with({"text": "Enter a number:", "reply_markup": ""})
+        # QuizHandler does not declare /tick: no empty answer from it
+        self.assertEqual(responses, [{"text": "Tick a", "reply_markup": ""}])
+        self.assertEqual([label for _, label in tick_handler.ticks], ["a"])
+
+    def test_ask_respond_round_trip(self):
+        """Test a prompt is asked, answered by text, then runs the action."""
+        # Arrange
+        service = self._create_service()
+        handler = QuizHandler()
+        service.handler = handler
+        sender = service._TelegramService__sender
+
+        # Act
+        asked = service._handle_callback_query({"callback_query": {"data": "ask:/quiz"}}, 5)
+        answered = service._handle_text_message("4", 5)
+        ignored = service._handle_text_message("5", 5)
+
+        # Assert
+        self.assertEqual(asked, [])
+        sender.send_message.assert_called_once_with({"text": "Enter a number:", "reply_markup": ""})
+        self.assertEqual(answered, [{"text": "Recorded 4.0", "reply_markup": ""}])
+        self.assertEqual(handler.answers, [4.0])
+        # The prompt is resolved: later text is not taken as an answer
+        self.assertEqual(ignored, [])
+        self.assertIsNone(self.history_manager.get_last_active_prompt(5))
+
+    def test_workers_keep_updates_of_a_chat_in_order(self):
+        """Test each chat is processed by a single worker, in arrival order."""
+        # Arrange
+        service = self._create_service(max_workers=2)
+        handler = TickHandler()
+        service.handler = handler
+        for index in range(20):
+            for chat_id in (1, 2):
+                data = f"/tick:{chat_id}-{index}"
+                update = {"callback_query": {"data": data, "message": {"chat": {"id": chat_id}}}}
+                service.incoming_queue.put((update, chat_id, "callback_query", {"data": data}))
+
+        # Act: the processor stops its workers once they are done
+        service.incoming_queue.put(None)
+        service._TelegramService__processor_thread.join(timeout=5)
+
+        # Assert
+        for chat_id in (1, 2):
+            ticks = [tick for tick in handler.ticks if tick[1].startswith(f"{chat_id}-")]
+            self.assertEqual([label for _, label in ticks], [f"{chat_id}-{i}" for i in range(20)])
+            (thread_name,) = {name for name, _ in ticks}
+            self.assertTrue(thread_name.startswith("tg-worker-"))
+
+    def test_refresh_handlers_picks_up_new_commands(self):
+        """Test commands added after registration are dispatched once refreshed."""
+        # Arrange
+        service = self._create_service()
+        handler = QuizHandler()
+        service.handler = handler
+        score = Command.from_value("/quiz_score")
+        handler.find_action(score)  # Builds the handler's own table
+        handler.extra_actions[score] = {
+            "action": lambda: {"text": "Score: 3", "reply_markup": ""},
+            "args": (),
+            "kwargs": {},
+        }
+
+        # Act
+        before = service._execute_command(score, [], 5)
+        service.refresh_handlers()
+        after = service._execute_command(score, [], 5)
+
+        # Assert
+        self.assertEqual(before, [])
+        self.assertEqual(after, [{"text": "Score: 3", "reply_markup": ""}])
+
+    def test_failed_answer_keeps_prompt_active(self):
+        """Test a prompt stays active when its respond callback fails."""
+        # Arrange
+        service = self._create_service()
+        handler = QuizHandler()
+        service.handler = handler
+        service._handle_callback_query({"callback_query": {"data": "ask:/quiz"}}, 5)
+
+        # Act
+        with self.assertRaises(ValueError):
+            service._handle_text_message("abc", 5)
+
+        # Assert: the user can answer again
+        self.assertIsNotNone(self.history_manager.get_last_active_prompt(5))
+        self.assertEqual(
+            service._handle_text_message("2.5", 5),
+            [{"text": "Recorded 2.5", "reply_markup": ""}],
+        )
+        self.assertEqual(handler.answers, [2.5])
+        self.assertIsNone(self.history_manager.get_last_active_prompt(5))
+
+
+if __name__ == "__main__":
+    unittest.main()